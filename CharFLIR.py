@@ -14,23 +14,61 @@
 
     TA_H_10_0.05_10.dat  HCG  10.0  0.05  10
 
-    The routine writes a file with this name containing the (numpy) data.
+    The routine writes a file with this name containing the (numpy) data, and a file
+    <Name>_meta.npy with one record per frame (FrameID, timestamp, exposure, gain, CRC).
+    Frame drops, throughput and time per stage go to <sCroot>_telemetry.jsonl (one line per
+    acquisition) and the run totals to <sCroot>.prom (see FLIR_Telemetry).
+
+    Each completed line is recorded in <sCroot>_state.jsonl, with checksums of its files
+    (see FLIR_Checkpoint). Run again after a crash, it skips the lines already done and
+    carries on with the log.
+
+    With adaptive = True each line stops as soon as the logged (chip-averaged) variance is
+    known to a relative standard error of targetRSE (FrameStats.variance_rse(), which grows
+    with offset drift from frame to frame), between minFrames and maxFrames frames, and the
+    number of frames actually used goes in the log.
 
 '''
 
-import numpy as np
+import os
 import time                  # To measure how long this takes
 import FLIR_Utils as FU      # All the camera interface stuff
+import FLIR_Stats as FS      # Streaming frame statistics
+import FLIR_Writer as FW     # Background writing of the data
+import FLIR_Sequencer as FQ  # Exposure ladders run by the camera's sequencer
+import FLIR_Telemetry as FT  # Frame-drop and throughput statistics
+import FLIR_BadPix as FB     # Bad-pixel masks
+import FLIR_Plan as FL       # Reading, checking and timing the script
+import FLIR_Features as FF   # Cached access to camera features
+import FLIR_Checkpoint as FK # Resuming interrupted runs
 
 start_time = time.time()     # And we're off...
 
 sCroot = 'MV_Feb13_2'         # File root for script, log file
 scriptFile = sCroot+'.txt'   # Script file of test runs
 logFile = sCroot+'.log'      # Log file
+telFile = sCroot+'_telemetry.jsonl'   # Acquisition statistics, one JSON line per script line (or chunk)
+promFile = sCroot+'.prom'    # Totals for the run, Prometheus text format
+stateFile = sCroot+'_state.jsonl'   # Completed lines, to resume an interrupted run
+boundsFile = 'FLIR_bounds.json'   # Camera gain and exposure bounds, for FLIR_Plan.py without the camera
 
 verbose = True
 
 frameWait = 1.0     # Wait this long between frames
+streaming = True    # Stream frames through a buffer pool (frameWait is then ignored)
+outFormat = 'npy'   # Output format: 'npy', 'npz' (compressed), 'fits' or 'fla' (compressed, 12-bit packed)
+useMemmap = False   # Write frames straight into a memory-mapped .npy file (for runs larger than RAM)
+useSequencer = False   # Run the script through the camera's sequencer, several lines per acquisition
+useChunks = True    # Per-frame metadata from the camera's chunk data, saved as <Name>_meta.npy
+pixelFormat = 'Mono16'   # Or 'Mono12p'/'Mono12Packed': same 12-bit values, 25% less data over the link
+maskFile = None     # Bad-pixel mask (FLIR_BadPix.Save_Mask) to leave out of the logged statistics, if any
+optimisePlan = False   # Reorder the script to cut gain mode switches and exposure jumps (FLIR_Plan.Optimise)
+resume = True       # Skip the lines completed by an earlier run of this script (False = start again from the top)
+useChecksums = True    # Record checksums of the files written (taken while writing), and check them before skipping completed lines
+adaptive = False    # Stop each line once its variance has converged (not with useSequencer or useMemmap)
+targetRSE = 0.01    # Relative standard error of the logged chip-averaged variance to stop at (adaptive; steady offsets reach it at minFrames)
+minFrames = 6       # At least this many frames per line (adaptive)
+maxFrames = 40      # At most this many frames per line (adaptive; the script's nFrames is not used)
 
 gainConv = 'HCG'    # CHANGE - will be read from script
 expTime = 1.0E6     # CHANGE = will be read from script
@@ -38,26 +76,158 @@ gain = 15.0         # # 47.994294 CHANGE - will be read from script
 
 ###--- Set up camera 
 
-cam,dev = FU.Setup_Camera(verbose,False)    # Instantiate camera and dev
-FU.Standard_Settings(cam,dev,verbose)       # Standard settings (full frame, etc.)
+cam,dev = FU.Setup_Camera(verbose,False,tuneNetwork=True)    # Instantiate camera and dev, packet size and bandwidth
+FU.Standard_Settings(cam,dev,verbose,pixelFormat=pixelFormat)   # Standard settings (full frame, etc.)
 FU.FLIR_Status(cam,dev)                     # Print out camera info
 
+if useChunks:                               # FrameID, timestamp, exposure, gain, CRC with every frame
+    FU.Enable_Chunks(cam,FU.CHUNKS+(['SequencerSetActive'] if useSequencer else []),verbose)
+
+###--- Read the script, check it against the camera and say how long it will take
+
+steps = FL.Read_Script(scriptFile)                   # One step per script line
+
+rateEnable = None                           # The exposure bounds depend on the frame rate limit:
+if streaming and cam.is_feature_available('AcquisitionFrameRateEnable'):   # read them with it off, as Iter_Frames runs
+    rateEnable = cam.get_boolean('AcquisitionFrameRateEnable')
+    cam.set_boolean('AcquisitionFrameRateEnable',False)
+try:
+    cache = FF.FeatureCache(cam,dev)
+    bounds = cache.snapshot(('static',))
+    bounds.update({name:cache.get(name) for name in ('frameRateBounds','expTimeBounds')})
+finally:
+    if rateEnable is not None:
+        cam.set_boolean('AcquisitionFrameRateEnable',rateEnable)
+FL.Save_Bounds(boundsFile,bounds)
+problems = FL.Validate(steps,bounds)
+for problem in problems:
+    print("ERROR - "+problem)
+if problems:
+    raise SystemExit(1)
+
+if optimisePlan:
+    steps = FL.Optimise(steps,first=cam.get_string('GainConversion'))
+
+###--- Open the log, and leave out the lines done in an earlier run (see FLIR_Checkpoint)
+
+if not resume and os.path.exists(stateFile):
+    os.remove(stateFile)                             # Start again from the top
+
+newLog = not resume or not os.path.exists(logFile) or os.path.getsize(logFile) == 0
+outLog = open(logFile,"w" if newLog else "a")        # Carry on with the log of an earlier run
+if newLog:
+    outLog.write("Filename  GainMode   Gain   ExpTime  nFrames  Temperature Mean  Variance\n")
+    outLog.flush()
+
+def writeLog(logLine):
+    ''' Writes one line of results to the log file, once the files of its line are on disk '''
+    outLog.write(logLine+"\n")
+    outLog.flush()
+    os.fsync(outLog.fileno())
+
+ck = FK.Checkpoint(stateFile,writeLog,useChecksums)
+for logLine in ck.missing_logs(logFile):             # Recorded, but not logged before the crash
+    writeLog(logLine)
+
+nSteps = len(steps)
+steps = [s for s in steps if not ck.is_done(s.fName,useChecksums)]
+if len(steps) < nSteps:
+    print ("")
+    print ("Skipping ",nSteps-len(steps)," of ",nSteps," lines, completed in an earlier run")
+
+plan = FL.Estimate(steps,cam.get_payload(),streaming,frameWait)
+print ("")
+print (len(steps)," steps, estimated time ","{:.2f}".format(plan['total']/3600.0)," hours (",plan['switches']," gain mode switches)")
+
 ###--- Now execute commands from script file, writing to log file
 
-inList = open(scriptFile,"r").read().splitlines()    # Now one set of parameters per line
-outLog = open(logFile,"w")                           # Open log file for text output
+runTel = FT.AcqTelemetry(sCroot)                     # Totals for the whole run
+
+writer = FW.CubeWriter(outFormat,telemetry=runTel)   # Writes the data while the camera carries on
+
+mask = FB.PixelMask(FB.Load_Mask(maskFile)) if maskFile else None
+
+stats = FS.FrameStats(mask=mask)    # Running mean/variance accumulator (reused per line)
+
+def written(fName):
+    ''' Writer callback: one of the two files (cube and _meta) of line fName is on disk '''
+    return lambda fileName,checksum: ck.file_written(fName,fileName,checksum)
+
+def reportDrops(metaList):
+    ''' Reports gaps in the frame IDs of one acquisition '''
+    dropped = FU.Find_Dropped_Frames(FU.Meta_Array(sorted(metaList,key=lambda meta: meta['frameID']))) if useChunks else []
+    if dropped:
+        print ("  WARNING - dropped frame IDs ",dropped)
+
+def saveMeta(fName,metaList,checkDrops=True):
+    ''' Queues the per-frame metadata for writing as <fName>_meta.npy, and reports dropped frames '''
+    writer.submit(fName+"_meta",FU.Meta_Array(metaList),'npy',done=written(fName))
+    if checkDrops:                   # Not per line in a sequencer chunk: its frames are interleaved
+        reportDrops(metaList)
+
+def logTelemetry(lineTel):
+    ''' Appends the statistics of one acquisition to telFile and updates the run totals in promFile '''
+    lineTel.write_json(telFile)
+    runTel.merge(lineTel)
+    runTel.write_prometheus(promFile)
+
+def logResult(fName,gainConv,gain,expTime,nFrames,temperature,mean,variance):
+    ''' Prints one line of results; it goes to the log file once the line's files are written '''
+    logLine = fName +" "+ gainConv +" "+ str(gain) +" "+ str("{:.3e}".format(expTime/1.0E6)) +" "+ str(nFrames) +" "+ str("{:.3f}".format(temperature)) +" "+ str("{:.3e}".format(mean)) +" "+ str("{:.3e}".format(variance))  
+    ck.set_log(fName,logLine)
+    print("  "+logLine)
+
+
+if useSequencer:     # Whole chunks of the script in one acquisition each (see FLIR_Sequencer)
+
+    chunkTel = FT.AcqTelemetry()           # Statistics of one chunk, reset after each
+
+    for chunk,frames in FQ.Iter_Ladder(cam,steps,verbose,telemetry=chunkTel):
+
+        print ("")
+        print ("Working on ",len(chunk)," files with ",chunk[0][4]," frames each, GainMode: ",chunk[0][1])   # Feedback
+
+        volts,current,power,temperature = FU.FLIR_Power(cam,dev,False)   # Get power temperature info
+
+        cubes = {step[0]:FU.New_Cube(cam,step[4]) for step in chunk}   # One cube per script line
+        nGot = {step[0]:0 for step in chunk}
+        metas = {step[0]:[] for step in chunk}
+        chunkMetas = []                           # Every frame of the chunk, for the dropped-frame check
+
+        for step,img,meta in frames:              # Frames of the different lines come interleaved
+            chunkMetas.append(meta)
+            if nGot[step[0]] >= step[4]:
+                print ("  WARNING - extra frame ",meta['frameID']," for ",step[0],", left out")
+                continue
+            cubes[step[0]][nGot[step[0]]] = img
+            nGot[step[0]] += 1
+            metas[step[0]].append(meta)
+
+        for fName,gainConv,gain,expTime,nFrames in chunk:
 
-outLog.write("Filename  GainMode   Gain   ExpTime  nFrames  Temperature Mean  Variance\n")
+            theFrames = cubes.pop(fName)[:nGot[fName]]
+            if nGot[fName] == 0:
+                print ("ERROR - No frames for ",fName,", not saved or logged (run the script again to retry)")
+                continue
+            ck.expect(fName,2)                     # The data and the metadata
+            writer.submit(fName,theFrames,done=written(fName))   # Write binary file of data (in the background)
+            saveMeta(fName,metas[fName],False)
 
+            stats.reset()
+            stats.add(theFrames)
+            logResult(fName,gainConv,gain,expTime,nGot[fName],temperature,stats.mean(),stats.variance())
 
-for i in range(len(inList)):     # Step through one line at a time
+        reportDrops(chunkMetas)                   # Frame IDs of the whole chunk run on without gaps
 
-    if inList[i][0]!="#":          # Ignore comment lines, if any
+        chunkTel.name = " ".join(step[0] for step in chunk)
+        logTelemetry(chunkTel)
+        chunkTel.reset()
 
-        ###--- Parse script file and provide feedback
+else:                # One script line at a time
 
-        vals = inList[i].split()   # Split out to individual items and then extract:
-        fName,gainConv,gain,expTime,nFrames = vals[0],vals[1],float(vals[2]),float(vals[3]),int(vals[4])
+    for i,(fName,gainConv,gain,expTime,nFrames) in enumerate(steps):     # Step through one line at a time
+
+        ###--- Provide feedback
 
         print ("")
         print ("Working on file ",i+1," with ",nFrames," frames and output ",fName)                 # Feedback
@@ -71,23 +241,85 @@ for i in range(len(inList)):     # Step through one line at a time
 
         volts,current,power,temperature = FU.FLIR_Power(cam,dev,False)   # Get power temperature info
 
-        theFrames = FU.Acquire_Frames(cam,nFrames,frameWait,verbose)       # Acquire the data
+        lineTel = FT.AcqTelemetry(fName)            # Frame drops, throughput and stage times of this line
+
+        if useMemmap:     # Each frame lands on disk as it is converted
+
+            mmName = FW.Cube_File(fName)           # Same name as np.save would use
+            theFrames = FU.New_Cube(cam,nFrames,mmName+'.tmp')   # Renamed when complete
+
+            metaList = []
+            for img,meta in FU.Iter_Frames(cam,nFrames,frameWait,verbose,streaming,out=theFrames,telemetry=lineTel):
+                metaList.append(meta)
+            nGot = len(metaList)
 
-        ###--- Now save binary data and quick-look results
+            theFrames.flush()
+            if nGot == 0:
+                print ("ERROR - No frames for ",fName,", not saved or logged (run the script again to retry)")
+                del theFrames
+                os.remove(mmName+'.tmp')
+                logTelemetry(lineTel)
+                continue
+            if nGot < nFrames:
+                print ("  WARNING - only ",nGot," frames; the rest of ",mmName," is empty")
 
-        np.save(fName,theFrames)               # Write binary file of data
+            ###--- Quick-look results, read back from the file in tiles of rows
 
-        mean = np.mean(theFrames)              # Average pixel value across chip
-        varMat = np.var(theFrames,axis=0)      # Collapse to 2D matrix of variances
-        variance = np.mean(varMat)             # The average variance across the chip
+            mean,variance = FS.Cube_Stats(theFrames[:nGot],mask=mask)
+            nFrames = nGot                     # Frames actually taken, for the log
+            del theFrames                      # Close the memmap
+            os.replace(mmName+'.tmp',mmName)
+            ck.expect(fName,2)                 # Complete once the data and metadata are written
+            ck.file_written(fName,mmName)
+            saveMeta(fName,metaList)
 
-        logLine = fName +" "+ gainConv +" "+ str(gain) +" "+ str("{:.3e}".format(expTime/1.0E6)) +" "+ str(nFrames) +" "+ str("{:.3f}".format(temperature)) +" "+ str("{:.3e}".format(mean)) +" "+ str("{:.3e}".format(variance))  
-        outLog.write(logLine+"\n")
-        print("  "+logLine)
+        else:
 
-inList.close     # Close script file
-outLog.flush     # Purge buffer, if needed
-outLog.close     # Close logfile
+            nTake = maxFrames if adaptive else nFrames
+            theFrames = FU.New_Cube(cam,nTake)     # Frames are converted straight into this
+            stats.reset()
+            metaList = []
+
+            for img,meta in FU.Iter_Frames(cam,nTake,frameWait,verbose,streaming,out=theFrames,telemetry=lineTel):
+                stats.add(img)                     # Statistics keep up with the frames as they arrive
+                metaList.append(meta)
+                if adaptive and stats.n >= minFrames:
+                    rse = stats.variance_rse()
+                    if rse is not None and rse < targetRSE:      # Converged: stop the acquisition here
+                        print ("  Variance converged after ",stats.n," frames (relative error ","{:.4f}".format(rse),")")
+                        break
+
+            theFrames = theFrames[:stats.n]        # Frames used (fewer if lost, or if converged early)
+
+            if stats.n == 0:
+                print ("ERROR - No frames for ",fName,", not saved or logged (run the script again to retry)")
+                logTelemetry(lineTel)
+                continue
+
+            ###--- Now save binary data and quick-look results
+
+            ck.expect(fName,2)                     # Complete once the data and metadata are written
+            writer.submit(fName,theFrames,done=written(fName))   # Write binary file of data (in the background)
+            saveMeta(fName,metaList)               #   and the per-frame metadata next to it
+
+            mean = stats.mean()                    # Average pixel value across chip
+            variance = stats.variance()            # The average variance across the chip
+            nFrames = stats.n                      # Frames actually used, for the log
+
+        logResult(fName,gainConv,gain,expTime,nFrames,temperature,mean,variance)
+        logTelemetry(lineTel)
+
+writer.close()   # Wait for the last files to be written
+runTel.write_prometheus(promFile)   # Now including the last write times
+outLog.flush()   # Purge buffer, if needed
+outLog.close()   # Close logfile
 
 print ("")
 print ("Elapsed time : ",(time.time() - start_time))
+
+failed = ck.pending()      # Lines with a file that could not be written
+if writer.errors or failed:
+    print ("")
+    print ("ERROR - ",len(writer.errors)," file(s) failed to write; not completed or logged: "," ".join(failed))
+    print ("  Run the script again to take them again")
+    raise SystemExit(1)
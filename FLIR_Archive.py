@@ -0,0 +1,279 @@
+'''
+    Compressed archive files for frame cubes: each frame compressed on its own, so any
+    frame can be read back without the others.
+
+        Write_Archive   - Writes a cube to an archive file in one go
+        ArchiveWriter   - Writes frames to an archive as they come, compressing in threads
+        ArchiveReader   - Reads frames back, singly, as slices or all at once
+
+    File layout:
+
+        b'FLIRARC1' | frame 0 | frame 1 | ... | index (JSON) | index offset (8 bytes) | b'FLIRARC1'
+
+    The index holds the frame shape and dtype, the codec, and the offset, length and
+    filter of every frame. Filters, chosen per frame:
+
+        pack12    - values fit in 12 bits (optionally after a shift: a 12-bit ADC read out as
+                    Mono16 may have the bottom 4 bits zero), packed as Mono12p (FLIR_Pack):
+                    1.5 instead of 2 bytes per pixel. The three bytes of each pixel pair
+                    are then stored as separate planes, which compress far better
+        shuffle   - for anything pack12 cannot take: high and low bytes as separate planes
+
+    Codecs: 'zlib' (standard library) or 'zstd' (needs the zstandard package; faster at the
+    same ratio). Both release the GIL while compressing, so nThreads threads compress
+    nThreads frames at once.
+
+'''
+
+import json
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import FLIR_Pack as FP       # 12-bit packing
+
+MAGIC = b'FLIRARC1'
+
+#--------------------------------------------------------------------------------------------
+
+def _codec(name,level):
+
+    ''' Returns compress, decompress functions for a codec '''
+
+    if name == 'zlib':
+        return (lambda b: zlib.compress(b,level)),zlib.decompress
+
+    elif name == 'zstd':
+        import zstandard              # Only needed for zstd archives
+        return (lambda b: zstandard.ZstdCompressor(level=level).compress(b)),\
+               (lambda b: zstandard.ZstdDecompressor().decompress(b))
+
+    else:
+        raise ValueError("Unknown codec "+str(name))
+
+def _shuffle(data,size):
+
+    ''' Byte planes of data (uint8, in groups of size bytes), as bytes '''
+
+    return np.ascontiguousarray(data.reshape(-1,size).T).tobytes()
+
+def _unshuffle(raw,size):
+
+    ''' Undoes _shuffle: returns the uint8 array in its original byte order '''
+
+    return np.ascontiguousarray(np.frombuffer(raw,dtype=np.uint8).reshape(size,-1).T).reshape(-1)
+
+def _encode(frame,compress,pack12):
+
+    ''' Filters and compresses one frame. Returns (blob, filter, shift) '''
+
+    frame = np.ascontiguousarray(frame)
+
+    if pack12 and frame.dtype == np.uint16:
+        hi = int(frame.max()) if frame.size else 0
+        if hi < 4096:
+            return compress(_shuffle(FP.Pack_Mono12p(frame),3)),'pack12',0
+        if not (frame & 0x0f).any():             # 12 bits in the top of 16
+            return compress(_shuffle(FP.Pack_Mono12p(frame >> 4),3)),'pack12',4
+
+    if frame.dtype.itemsize > 1:
+        return compress(_shuffle(frame.view(np.uint8).reshape(-1),frame.dtype.itemsize)),'shuffle',0
+
+    return compress(frame.tobytes()),'none',0
+
+#--------------------------------------------------------------------------------------------
+
+class ArchiveWriter:
+
+    '''
+        Writes frames to an archive file, in order, while compressing up to nThreads
+        frames at once in the background.
+
+            Input:    fName - file name, or a file object open for writing (written to in
+                              order, and left open)
+                      codec - 'zlib' or 'zstd'
+                      level - compression level (low is fast; 1 keeps up with acquisition)
+                      pack12 - pack 12-bit data (see above)
+                      nThreads - compression threads
+                      meta - (optional) dict stored in the index (e.g. the script line)
+
+        Use as a context manager, or call close() to write the index:
+
+            with ArchiveWriter('TA_H_10_0.05.fla') as arc:
+                for img,meta in FU.Iter_Frames(...):
+                    arc.write(img)
+    '''
+
+    def __init__(self,fName,codec='zlib',level=1,pack12=True,nThreads=4,meta=None):
+
+        self.fName = fName
+        self.codec = codec
+        self.level = level
+        self.pack12 = pack12
+        self.meta = dict(meta or {})
+        self._compress = _codec(codec,level)[0]
+        self._pool = ThreadPoolExecutor(nThreads)
+        self._pending = deque()          # Futures, in frame order
+        self._maxPending = 2*nThreads    # Frames allowed in flight (bounds the memory used)
+        self._frames = []                # (offset, length, filter, shift) per frame written
+        self.shape = None
+        self.dtype = None
+
+        self._ownFile = not hasattr(fName,'write')
+        self._f = open(fName,"wb") if self._ownFile else fName
+        self._f.write(MAGIC)
+
+    def write(self,frame):
+
+        '''
+            Queues a frame (2D), or every frame of a cube, for compression. The frame must
+            not change until it has been written (at most 2*nThreads frames later).
+        '''
+
+        frame = np.asarray(frame)
+
+        if frame.ndim == 3:
+            for f in frame:
+                self.write(f)
+            return
+
+        if self.shape is None:
+            self.shape,self.dtype = frame.shape,frame.dtype
+        elif frame.shape != self.shape or frame.dtype != self.dtype:
+            raise ValueError("Frame "+str(frame.shape)+" "+str(frame.dtype)+" does not match "+
+                             str(self.shape)+" "+str(self.dtype))
+
+        self._pending.append(self._pool.submit(_encode,frame,self._compress,self.pack12))
+
+        while len(self._pending) > self._maxPending:
+            self._store(self._pending.popleft().result())
+
+    def _store(self,encoded):
+
+        blob,filt,shift = encoded
+        self._frames.append((self._f.tell(),len(blob),filt,shift))
+        self._f.write(blob)
+
+    def close(self):
+
+        ''' Writes the remaining frames and the index, and closes the file '''
+
+        if self._f is None:
+            return
+
+        while self._pending:
+            self._store(self._pending.popleft().result())
+        self._pool.shutdown()
+
+        index = {'shape':list(self.shape or ()), 'dtype':str(self.dtype), 'codec':self.codec,
+                 'frames':self._frames, 'meta':self.meta}
+
+        indexOffset = self._f.tell()
+        self._f.write(json.dumps(index).encode())
+        self._f.write(struct.pack('<Q',indexOffset))
+        self._f.write(MAGIC)
+        if self._ownFile:
+            self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+#--------------------------------------------------------------------------------------------
+
+def Write_Archive(fName,data,**kwargs):
+
+    '''
+        Writes a frame or cube to an archive file. kwargs are passed on to ArchiveWriter.
+    '''
+
+    with ArchiveWriter(fName,**kwargs) as arc:
+        arc.write(data)
+
+#--------------------------------------------------------------------------------------------
+
+class ArchiveReader:
+
+    '''
+        Reads an archive file. Frames are read and decompressed only when asked for:
+
+            arc = ArchiveReader('TA_H_10_0.05.fla')
+            img = arc[3]               # One frame
+            cube = arc[:]              # All of them, as a (nFrames, H, W) array
+            tile = arc[:,0:100]        # Any numpy index; the frames are read first
+
+            Input:    fName - file name
+    '''
+
+    def __init__(self,fName):
+
+        self.fName = fName
+
+        with open(fName,"rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(fName+" is not an archive file")
+            f.seek(-8-len(MAGIC),2)
+            indexOffset = struct.unpack('<Q',f.read(8))[0]
+            end = f.tell()
+            f.seek(indexOffset)
+            index = json.loads(f.read(end-8-indexOffset).decode())
+
+        self.frameShape = tuple(index['shape'])
+        self.dtype = np.dtype(index['dtype'])
+        self.codec = index['codec']
+        self.meta = index['meta']
+        self._frames = index['frames']
+        self._decompress = _codec(self.codec,0)[1]
+
+        self.shape = (len(self._frames),)+self.frameShape
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+
+        return len(self._frames)
+
+    def frame(self,k,out=None):
+
+        ''' Reads frame k (into out, if given) '''
+
+        offset,length,filt,shift = self._frames[k]
+
+        with open(self.fName,"rb") as f:
+            f.seek(offset)
+            raw = self._decompress(f.read(length))
+
+        if out is None:
+            out = np.empty(self.frameShape,dtype=self.dtype)
+
+        if filt == 'pack12':
+            FP.Unpack_Mono12p(_unshuffle(raw,3),self.frameShape,out)
+            if shift:
+                out <<= shift
+        elif filt == 'shuffle':
+            out.view(np.uint8).reshape(-1)[...] = _unshuffle(raw,self.dtype.itemsize)
+        else:
+            out.reshape(-1)[...] = np.frombuffer(raw,dtype=self.dtype)
+
+        return out
+
+    def __getitem__(self,key):
+
+        if not isinstance(key,tuple):
+            key = (key,)
+        first,rest = key[0],key[1:]
+
+        if isinstance(first,(int,np.integer)):
+            return self.frame(first)[rest]
+
+        ks = range(len(self))[first]
+        cube = np.empty((len(ks),)+self.frameShape,dtype=self.dtype)
+        for i,k in enumerate(ks):
+            self.frame(k,cube[i])
+
+        return cube[(slice(None),)+rest]
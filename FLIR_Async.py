@@ -0,0 +1,287 @@
+'''
+    asyncio interface to a FLIR camera, so that an actor can keep serving commands (and
+    run several cameras) while exposures and resets are in progress.
+
+      AsyncFLIRCamera   - Awaitable expose(), set_config(), guide_mode(), status() and reset()
+
+    Register access (GenICam reads and writes) is serialized through one worker thread per
+    camera. Frames are not waited for in a thread at all: the Aravis stream emits a
+    "new-buffer" signal from its own receiving thread, where the buffer is converted to
+    numpy and handed to the event loop with call_soon_threadsafe.
+
+    Typical use:
+
+        cam = await AsyncFLIRCamera.open(verbose=True)
+        await cam.set_config(expTime=0.5,gain=5.0,gainConv='HCG')
+        img,meta = await cam.expose()
+        await cam.close()
+
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import gi           # To ensure correct Aravis version
+gi.require_version('Aravis', '0.8')     # Version check
+from gi.repository import Aravis        # Aravis package
+
+import FLIR_Utils as FU      # All the camera interface stuff
+import FLIR_Features as FF   # Cached access to camera features
+
+#--------------------------------------------------------------------------------------------
+
+class AsyncFLIRCamera:
+
+    '''
+        Wraps an Aravis camera for use from asyncio. Create it with the open() coroutine.
+
+            Input:    cam, dev - as returned by FLIR_Utils.Setup_Camera
+                      verbose - how wordy to be
+                      nBuffers - buffers in the stream pool
+                      margin - seconds allowed on top of the exposure time before an
+                               exposure is considered to have timed out
+    '''
+
+    def __init__(self,cam,dev,verbose=False,nBuffers=4,margin=2.0):
+
+        self.cam = cam
+        self.dev = dev
+        self.devId = cam.get_device_id()
+        self.verbose = verbose
+        self.nBuffers = nBuffers
+        self.margin = margin
+
+        self._executor = ThreadPoolExecutor(1,thread_name_prefix="FLIR-"+self.devId)   # All register access
+        self._loop = None
+        self._frames = None          # asyncio.Queue of (img, meta), filled from the stream thread
+        self._stream = None
+        self._payload = 0
+        self._lock = asyncio.Lock()  # One exposure (or reset) at a time
+        self.cache = FF.FeatureCache(cam,dev)
+
+    @classmethod
+    async def open(cls,verbose=False,fakeCam=False,devIndex=0,settings=True,**kwargs):
+
+        '''
+            Opens camera number devIndex (see FLIR_Utils.Setup_Camera) and, if settings is
+            True, applies FLIR_Utils.Standard_Settings. Returns the AsyncFLIRCamera.
+        '''
+
+        loop = asyncio.get_running_loop()
+
+        def setup():
+            cam,dev = FU.Setup_Camera(verbose,fakeCam,devIndex)
+            if cam is not None and settings:
+                FU.Standard_Settings(cam,dev,verbose)
+            return cam,dev
+
+        cam,dev = await loop.run_in_executor(None,setup)
+
+        if cam is None:
+            raise RuntimeError("No camera found")
+
+        self = cls(cam,dev,verbose,**kwargs)
+        self._loop = loop
+        self._frames = asyncio.Queue()
+
+        return self
+
+    async def _call(self,func,*args):
+
+        ''' Runs a blocking camera call on this camera's worker thread '''
+
+        return await self._loop.run_in_executor(self._executor,func,*args)
+
+    #--- Stream handling (runs in the Aravis stream thread)
+
+    def _on_new_buffer(self,stream):
+
+        buf = stream.try_pop_buffer()
+
+        if buf is None:
+            return
+
+        if buf.get_status() == Aravis.BufferStatus.SUCCESS:
+            img = FU.FLIR2numpy(buf,False)     # Independent of the buffer, which goes back to the pool
+            meta = {'frameID':buf.get_frame_id(), 'timestamp':buf.get_timestamp()}
+            item = (img,meta)
+        else:
+            item = RuntimeError("Frame failed with status "+str(buf.get_status()))
+
+        stream.push_buffer(buf)                                        # Back to the pool
+        self._loop.call_soon_threadsafe(self._frames.put_nowait,item)  # Over to the event loop
+
+    def _open_stream(self):
+
+        '''
+            (Re)creates the stream if there is none yet, or if the payload has changed
+            (e.g. after a change of RoI or pixel format). Called on the worker thread.
+        '''
+
+        payload = self.cam.get_payload()
+
+        if self._stream is not None and payload == self._payload:
+            return
+
+        self._stream = FU.Open_Stream(self.cam,self.nBuffers,self.verbose)
+        self._stream.set_emit_signals(True)
+        self._stream.connect("new-buffer",self._on_new_buffer)
+        self._payload = payload
+
+    #--- Public interface
+
+    async def set_config(self,expTime=None,gain=None,gainConv=None):
+
+        '''
+            Sets exposure time (seconds), gain and/or gain conversion mode ('HCG' or 'LCG').
+            Anything left as None is not touched.
+        '''
+
+        def config():
+            self.cache.invalidate(('settings',))
+            if gainConv is not None:
+                self.cam.set_string('GainConversion',gainConv)
+            if gain is not None:
+                self.cam.set_gain(gain)
+            if expTime is not None:
+                self.cam.set_exposure_time(expTime*1.0E6)
+
+        await self._call(config)
+
+    async def guide_mode(self,rois,binning=1,decimation=1,frameRate=None):
+
+        '''
+            Switches to reading out only the guide RoIs (see FLIR_Utils.Guide_Mode) and
+            returns their boxes, for FLIR_Utils.Cut_ROIs. The stream is resized at the
+            next expose().
+        '''
+
+        async with self._lock:
+            boxes = await self._call(FU.Guide_Mode,self.cam,rois,binning,decimation,frameRate,self.verbose)
+            self.cache.invalidate(('settings',))
+
+        return boxes
+
+    async def full_frame(self):
+
+        ''' Switches back to the full frame (see FLIR_Utils.Full_Frame) '''
+
+        async with self._lock:
+            await self._call(FU.Full_Frame,self.cam,self.verbose)
+            self.cache.invalidate(('settings',))
+
+    async def expose(self,nFrames=1,expTime=None,gain=None,gainConv=None,timeout=None):
+
+        '''
+            Takes nFrames frames (optionally setting exposure time, gain and gain mode first)
+            and returns img,meta for a single frame, or a list of (img, meta) otherwise.
+
+            Each frame must arrive within timeout seconds, by default the exposure time plus
+            self.margin; otherwise asyncio.TimeoutError is raised and the acquisition stopped.
+        '''
+
+        async with self._lock:
+
+            await self.set_config(expTime,gain,gainConv)
+
+            saved = {}          # Settings changed for this exposure, put back afterwards (as FU.Iter_Frames)
+
+            def start():
+                self._open_stream()
+                exp,gn = self.cam.get_exposure_time(),self.cam.get_gain()
+                saved['acqMode'] = self.cam.get_acquisition_mode()
+                if self.cam.is_feature_available('AcquisitionFrameRateEnable'):  # (not on the fake camera)
+                    saved['rateEnable'] = self.cam.get_boolean('AcquisitionFrameRateEnable')
+                if nFrames==1:
+                    self.cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('SingleFrame')) )
+                elif self.cam.is_feature_available('AcquisitionFrameCount'):
+                    self.cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('MultiFrame')) )
+                    self.cam.set_integer('AcquisitionFrameCount',nFrames)      # Camera stops by itself after nFrames
+                else:
+                    self.cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('Continuous')) )   # Stopped below
+                if 'rateEnable' in saved:
+                    self.cam.set_boolean('AcquisitionFrameRateEnable',False)  # Run as fast as exposure allows
+                self.cam.start_acquisition()
+                return exp,gn
+
+            def stop():
+                self.cam.stop_acquisition()
+                if 'acqMode' in saved:
+                    self.cam.set_acquisition_mode(saved['acqMode'])            # Back to previous settings
+                if 'rateEnable' in saved:
+                    self.cam.set_boolean('AcquisitionFrameRateEnable',saved['rateEnable'])
+
+            while not self._frames.empty():       # Forget anything left over
+                self._frames.get_nowait()
+
+            frames = []
+            try:
+                exp,gn = await self._call(start)
+
+                if timeout is None:
+                    timeout = exp/1.0E6 + self.margin
+
+                for k in range(nFrames):
+                    item = await asyncio.wait_for(self._frames.get(),timeout)
+                    if isinstance(item,Exception):
+                        raise item
+                    img,meta = item
+                    meta.update({'index':k, 'exposure':exp, 'gain':gn})
+                    frames.append((img,meta))
+            finally:
+                await self._call(stop)
+
+        return frames[0] if nFrames==1 else frames
+
+    async def status(self):
+
+        '''
+            Returns a dict of all camera features (see FLIR_Features.FeatureCache.snapshot).
+            Only volatile values and settings changed since the last call are read again.
+        '''
+
+        return await self._call(self.cache.snapshot)
+
+    async def reset(self,wait=5.0,retries=10,settings=True):
+
+        '''
+            Issues DeviceReset and waits (without blocking the event loop) for the camera
+            to come back, then reconnects and, if settings is True, re-applies
+            Standard_Settings. Tries every wait seconds, up to retries times.
+        '''
+
+        async with self._lock:
+
+            print("Issuing DeviceReset Command")
+            await self._call(self.dev.execute_command,'DeviceReset')
+
+            self._stream = None
+
+            for attempt in range(retries):
+
+                await asyncio.sleep(wait)     # Need some time to restart
+
+                def reconnect():
+                    Aravis.update_device_list()
+                    cam = Aravis.Camera.new(self.devId)
+                    return cam,cam.get_device()
+
+                try:
+                    self.cam,self.dev = await self._call(reconnect)
+                    self.cache = FF.FeatureCache(self.cam,self.dev)     # New connection
+                    break
+                except Exception:
+                    if self.verbose:
+                        print ("  Camera not back yet...")
+            else:
+                raise RuntimeError("Camera "+self.devId+" did not come back after reset")
+
+            if settings:
+                await self._call(FU.Standard_Settings,self.cam,self.dev,self.verbose)
+
+    async def close(self):
+
+        ''' Stops the worker thread. The camera itself is left as it is. '''
+
+        self._stream = None
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,198 @@
+'''
+    Finds the longest exposure time before saturation for each gain and gain conversion
+    mode, to replace the hand-measured tables in WriteTestScript*.py and read_FLIR.py.
+
+          Histogram12   - 4096-bin histogram of a 12-bit frame (np.bincount)
+   Saturated_Fraction   - Fraction of pixels at or above a level, from the histogram
+    Find_Max_Exposure   - Searches the exposure time at which a given fraction saturates
+          Find_Limits   - Runs Find_Max_Exposure for every gain and mode
+         Write_Limits   - Writes the gain, eTHmax and eTLmax tables as JSON
+
+    The search uses single frames of a small RoI in the centre of the sensor (through
+    FLIR_Utils.Set_Geometry), so each step costs the exposure time and little else. It
+    first doubles (or halves) the exposure time until it brackets the limit, then bisects
+    (in log time) until the bracket is within relTol. The illumination must be steady
+    while it runs.
+
+    Run it as:
+
+        python FLIR_AutoRange.py ExpLimits.json
+
+    and set limitsFile = 'ExpLimits.json' in WriteTestScript.py or WriteTestScript_MV.py.
+
+'''
+
+import json
+import sys
+import time
+
+import numpy as np
+
+import FLIR_Utils as FU      # All the camera interface stuff
+
+#--------------------------------------------------------------------------------------------
+
+def Histogram12(img):
+
+    '''
+        Histogram of a frame of 12-bit values, one bin per value (4096 bins). Frames with
+        the 12 bits in the top of 16 (values above 4095) are shifted down first.
+    '''
+
+    shift = 4 if img.max() > 4095 else 0
+
+    return np.bincount((img >> shift).reshape(-1),minlength=4096)[:4096]
+
+#--------------------------------------------------------------------------------------------
+
+def Saturated_Fraction(hist,level=4000):
+
+    ''' Fraction of the pixels in hist (from Histogram12) at or above level '''
+
+    return hist[level:].sum()/hist.sum()
+
+#--------------------------------------------------------------------------------------------
+
+def Find_Max_Exposure(cam,gainConv,gain,target=0.01,level=4000,tStart=0.01,tMax=30.0,relTol=0.05,
+                      verbose=False):
+
+    '''
+        Finds the longest exposure time at which less than target of the pixels reach
+        level. The RoI must already be set (see Find_Limits).
+
+            Input:    cam - the camera
+                      gainConv, gain - gain conversion mode ('HCG' or 'LCG') and gain
+                      target - fraction of pixels allowed at or above level
+                      level - saturation level (ADU, 12-bit)
+                      tStart - exposure time to start from (sec)
+                      tMax - longest exposure time to consider (sec)
+                      relTol - relative precision of the result
+                      verbose - how wordy to be
+            Returns:  expTime - the limit (sec); tMax if it never saturates
+    '''
+
+    cam.set_string('GainConversion',gainConv)
+    cam.set_gain(gain)
+
+    expMin,expMax = cam.get_exposure_time_bounds()         # uSec
+    tMin,tMax = expMin/1.0E6,min(tMax,expMax/1.0E6)
+
+    def saturated(t):
+        cam.set_exposure_time(t*1.0E6)
+        img = FU.Acquire_Frames(cam,1,0.0)
+        if img is None:                   # No frame: no basis for a decision
+            raise RuntimeError("No frame at exposure time "+str(t)+" sec")
+        frac = Saturated_Fraction(Histogram12(img),level)
+        if verbose:
+            print ("    ",gainConv," gain ",gain,"  exposure ","{:.4g}".format(t)," sec  saturated ","{:.4f}".format(frac))
+        return frac >= target
+
+    t = min(max(tStart,tMin),tMax)
+
+    if saturated(t):              # Halve until it is not
+        hi = t
+        while True:
+            if t <= tMin:
+                return tMin       # Saturated even at the shortest exposure
+            t = max(t/2.0,tMin)
+            if not saturated(t):
+                lo = t
+                break
+            hi = t
+    else:                         # Double until it is
+        lo = t
+        while True:
+            if t >= tMax:
+                return tMax       # Never saturates
+            t = min(t*2.0,tMax)
+            if saturated(t):
+                hi = t
+                break
+            lo = t
+
+    while hi/lo > 1.0+relTol:     # Bisect in log time
+        t = np.sqrt(lo*hi)
+        if saturated(t):
+            hi = t
+        else:
+            lo = t
+
+    return lo
+
+#--------------------------------------------------------------------------------------------
+
+def Find_Limits(cam,gains,gModes=('HCG','LCG'),roiSize=128,verbose=False,**kwargs):
+
+    '''
+        Finds the exposure limit for every gain and gain mode, on a roiSize x roiSize RoI
+        in the centre of the sensor. The camera is set back to the full frame afterwards.
+
+            Input:    cam - the camera
+                      gains - list of gains
+                      gModes - gain conversion modes
+                      roiSize - RoI width and height (sensor pixels)
+                      verbose - how wordy to be
+                      kwargs - passed on to Find_Max_Exposure (target, level, tMax, ...)
+            Returns:  dict of gain mode -> list of limits (sec), one per gain
+    '''
+
+    sensorWid,sensorHgt = cam.get_sensor_size()
+    FU.Set_Geometry(cam,(sensorWid-roiSize)//2,(sensorHgt-roiSize)//2,roiSize,roiSize,verbose=verbose)
+
+    tFirst = kwargs.pop('tStart',0.01)
+    limits = {}
+    try:
+        for mode in gModes:
+            limits[mode] = [None]*len(gains)
+            tStart = tFirst
+            for i in np.argsort(gains):   # Lowest gain first
+                t = Find_Max_Exposure(cam,mode,gains[i],tStart=tStart,verbose=verbose,**kwargs)
+                limits[mode][i] = t
+                tStart = t                # Next gain up: the limit is shorter, but not by much
+                if verbose:
+                    print ("  ",mode," gain ",gains[i]," : max exposure ","{:.4g}".format(t)," sec")
+    finally:
+        FU.Full_Frame(cam,verbose)
+
+    return limits
+
+#--------------------------------------------------------------------------------------------
+
+def Write_Limits(fName,gains,limits,**info):
+
+    '''
+        Writes the limits as JSON, with the names the script generators use:
+        gain, eTHmax (HCG) and eTLmax (LCG), plus the date and any extra info
+        (e.g. target, level).
+    '''
+
+    table = {'gain':list(gains), 'eTHmax':limits.get('HCG'), 'eTLmax':limits.get('LCG'),
+             'date':time.strftime("%Y-%m-%d %H:%M:%S")}
+    table.update(info)
+
+    with open(fName,"w") as f:
+        json.dump(table,f,indent=1)
+
+#--------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    limitsFile = sys.argv[1] if len(sys.argv) > 1 else 'ExpLimits.json'
+    verbose = True
+
+    gains = [0.0,5.0,15.0,25.0,35.0,45.0,47.994294]    # As in the script generators
+    target,level = 0.01,4000                           # 1% of pixels at 4000 ADU or more
+
+    cam,dev = FU.Setup_Camera(verbose,False)    # Instantiate camera and dev
+    FU.Standard_Settings(cam,dev,verbose)       # Standard settings (full frame, etc.)
+
+    start_time = time.time()
+    limits = Find_Limits(cam,gains,verbose=verbose,target=target,level=level)
+    Write_Limits(limitsFile,gains,limits,target=target,level=level)
+
+    print ("")
+    print ("Gain    HCG   LCG")
+    for i,gain in enumerate(gains):
+        print (gain,"  ","{:.3g}".format(limits['HCG'][i]),"  ","{:.3g}".format(limits['LCG'][i]))
+    print ("")
+    print ("Written to ",limitsFile,"  Elapsed time : ",(time.time() - start_time))
@@ -0,0 +1,174 @@
+'''
+    Bad-pixel maps and statistics that leave the bad pixels out.
+
+           Build_Mask   - Marks hot, dead, noisy and odd-gain pixels from master dark/flat frames
+            Save_Mask   - Writes a mask as a bit-packed file (1 bit per pixel)
+            Load_Mask   - Reads it back
+            PixelMask   - Mask with precomputed bad pixel positions, for fast masked sums and means
+
+    Standard_Settings turns the camera's own defect correction (DefectCorrectStaticEnable)
+    off, so hot and dead pixels are in the data. Rather than a numpy masked array per frame,
+    PixelMask keeps the (few) bad pixel coordinates: a masked sum is the plain sum minus the
+    sum over the bad pixels, so it costs hardly more than np.sum and makes no frame-sized
+    temporaries.
+
+    Typical use:
+
+        mask = Build_Mask(darkRate=FC.Master_Dark(...),flat=FC.Master_Flat(...))
+        Save_Mask('BadPix.npz',mask)
+
+        pm = PixelMask(Load_Mask('BadPix.npz'))
+        stats = FLIR_Stats.FrameStats(mask=pm)
+
+'''
+
+import numpy as np
+
+#--------------------------------------------------------------------------------------------
+
+def _robust_sigma(arr):
+
+    ''' Median and standard deviation (from the median absolute deviation) of arr '''
+
+    med = np.median(arr)
+
+    return med,1.4826*np.median(np.abs(arr-med))
+
+#--------------------------------------------------------------------------------------------
+
+def Build_Mask(darkRate=None,flat=None,noise=None,nSigma=5.0,flatLow=0.5,flatHigh=1.5):
+
+    '''
+        Builds a bad-pixel mask (True = bad) from any of:
+
+            Input:    darkRate - master dark rate (FLIR_Calib.Master_Dark): hot pixels are
+                                 more than nSigma above the median
+                      flat - master flat (FLIR_Calib.Master_Flat): dead or odd-gain pixels
+                             are outside flatLow..flatHigh, or more than nSigma from the median
+                      noise - per-pixel noise (e.g. sqrt of FrameStats.var_map() of a dark
+                              cube): noisy (e.g. telegraph) pixels are more than nSigma above
+                              the median
+                      nSigma - threshold in robust standard deviations
+                      flatLow, flatHigh - absolute limits for the flat
+            Returns:  boolean mask
+    '''
+
+    maps = [m for m in (darkRate,flat,noise) if m is not None]
+    if not maps:
+        raise ValueError("Build_Mask needs at least one of darkRate, flat, noise")
+
+    mask = np.zeros(maps[0].shape,dtype=bool)
+
+    for m in (darkRate,noise):                # Only too high is bad
+        if m is not None:
+            med,sigma = _robust_sigma(m)
+            mask |= m > med + nSigma*sigma
+
+    if flat is not None:
+        med,sigma = _robust_sigma(flat)
+        mask |= (flat < flatLow) | (flat > flatHigh) | (np.abs(flat-med) > nSigma*sigma)
+
+    return mask
+
+#--------------------------------------------------------------------------------------------
+
+def Save_Mask(fName,mask):
+
+    '''
+        Writes a boolean mask to fName (.npz), packed 8 pixels to a byte.
+    '''
+
+    np.savez_compressed(fName,bits=np.packbits(mask,axis=None),shape=mask.shape)
+
+#--------------------------------------------------------------------------------------------
+
+def Load_Mask(fName):
+
+    '''
+        Reads a mask written by Save_Mask. Returns the boolean mask.
+    '''
+
+    with np.load(fName) as f:
+        shape = tuple(f['shape'])
+        return np.unpackbits(f['bits'],count=int(np.prod(shape))).reshape(shape).astype(bool)
+
+#--------------------------------------------------------------------------------------------
+
+class PixelMask:
+
+    '''
+        A bad-pixel mask, kept as the sorted list of bad pixel coordinates.
+
+            Input:    mask - boolean array, True = bad (e.g. from Load_Mask)
+
+        The reductions take a 2D map, a tile of rows of it (r0 = first row), or a stack
+        of frames (leading dimensions are summed over as well).
+    '''
+
+    def __init__(self,mask):
+
+        self.mask = np.asarray(mask,dtype=bool)
+        self.shape = self.mask.shape
+        self.ys,self.xs = np.nonzero(self.mask)     # In row order
+        self.nBad = len(self.ys)
+        self.nGood = self.mask.size - self.nBad
+
+    def cut(self,region):
+
+        '''
+            The mask for a RoI (x, y, width, height, as FLIR_Utils.Set_Geometry; unbinned).
+        '''
+
+        x,y,w,h = region
+
+        return PixelMask(self.mask[y:y+h,x:x+w])
+
+    def _bad(self,r0,nRows):
+
+        ''' Coordinates (relative to row r0) of the bad pixels in rows r0..r0+nRows-1 '''
+
+        i0,i1 = np.searchsorted(self.ys,[r0,r0+nRows])
+
+        return self.ys[i0:i1]-r0,self.xs[i0:i1]
+
+    def sum(self,arr,r0=0):
+
+        ''' Sum of arr over the good pixels '''
+
+        ys,xs = self._bad(r0,arr.shape[-2])
+
+        return arr.sum(dtype=np.float64) - arr[...,ys,xs].sum(dtype=np.float64)
+
+    def count(self,arr,r0=0):
+
+        ''' Number of good values in arr '''
+
+        ys,xs = self._bad(r0,arr.shape[-2])
+
+        return arr.size - len(ys)*(arr.size//(arr.shape[-2]*arr.shape[-1]))
+
+    def mean(self,arr,r0=0):
+
+        ''' Mean of arr over the good pixels '''
+
+        return self.sum(arr,r0)/self.count(arr,r0)
+
+    def grid_mean(self,arr,grid):
+
+        '''
+            Means over the good pixels of each region of a gy x gx grid of a 2D map (edges
+            beyond the grid are left out). Returns a (gy, gx) array.
+        '''
+
+        gy,gx = grid
+        ry,rx = arr.shape[0]//gy,arr.shape[1]//gx
+
+        sums = arr[:gy*ry,:gx*rx].reshape(gy,ry,gx,rx).sum(axis=(1,3),dtype=np.float64)
+        counts = np.full((gy,gx),float(ry*rx))
+
+        inGrid = (self.ys < gy*ry) & (self.xs < gx*rx)
+        ys,xs = self.ys[inGrid],self.xs[inGrid]
+        np.add.at(sums,(ys//ry,xs//rx),-arr[ys,xs])
+        np.add.at(counts,(ys//ry,xs//rx),-1.0)
+
+        return sums/counts
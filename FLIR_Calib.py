@@ -0,0 +1,291 @@
+'''
+    Calibration products (master bias, dark rate and flat) from stored FLIR cubes, and
+    their application to live frames.
+
+      Clipped_Combine   - Sigma-clipped mean or median of a set of cubes, in tiles of rows
+          Master_Bias   - Master bias from zero-exposure (or shortest exposure) cubes
+          Master_Dark   - Dark rate (ADU/sec) from dark cubes of known exposure times
+          Master_Flat   - Normalised flat field from illuminated cubes
+         Save_Masters   - Writes bias, dark and flat to a single .npz file
+           Calibrator   - Applies (img - bias - dark*t) / flat to frames, without temporaries
+
+    The cubes are read back with FLIR_Writer.Read_Cube, i.e. memory-mapped for .npy files,
+    and combined nRows rows at a time across all their frames. Only one tile of rows is
+    held in memory (as float32), however many frames there are.
+
+    Typical use:
+
+        bias = Master_Bias(['Bias_1.dat','Bias_2.dat'])
+        dark = Master_Dark(['Dark_10.dat','Dark_30.dat'],[10.0,30.0],bias)
+        flat = Master_Flat(['Flat_H.dat'],bias,dark,[0.5])
+        Save_Masters('Masters.npz',bias,dark,flat)
+
+        calib = Calibrator.load('Masters.npz')
+        img = calib.apply(FU.Acquire_Frames(cam,1),expTime)
+
+'''
+
+import numpy as np
+
+import FLIR_Writer as FW     # Reading the cubes back
+
+#--------------------------------------------------------------------------------------------
+
+def Clipped_Combine(cubes,method='mean',nSigma=3.0,nIter=3,nRows=64,frameScale=None,offset=None):
+
+    '''
+        Combines all frames of a list of cubes pixel by pixel, rejecting outliers (cosmic
+        rays, hot pixels in a single frame) that are more than nSigma standard deviations
+        from the per-pixel median. The standard deviation is estimated from the median
+        absolute deviation, so that a single large outlier among a few frames is still
+        caught. Repeated nIter times or until nothing more is rejected.
+
+            Input:    cubes - list of 3D arrays (or memmaps), or of file names for Read_Cube.
+                              All frames must have the same size.
+                      method - 'mean' or 'median' of the surviving values
+                      nSigma - clipping threshold
+                      nIter - maximum number of clipping passes
+                      nRows - rows per tile
+                      frameScale - (optional) one factor per frame (over all cubes, in
+                                   order), each frame is multiplied by after the offset
+                      offset - (optional) 2D map subtracted from every frame first, or a
+                               list of one map per cube
+            Returns:  the combined 2D float32 frame
+    '''
+
+    cubes = [FW.Read_Cube(c) if isinstance(c,str) else c for c in cubes]
+    cubes = [c[np.newaxis] if c.ndim == 2 else c for c in cubes]
+
+    nFrames = sum(len(c) for c in cubes)
+    height,width = cubes[0].shape[1:]
+
+    if frameScale is not None:
+        frameScale = np.asarray(frameScale,dtype=np.float32).reshape(nFrames,1,1)
+
+    combine = np.nanmedian if method == 'median' else np.nanmean
+
+    result = np.empty((height,width),dtype=np.float32)
+    tile = np.empty((nFrames,nRows,width),dtype=np.float32)     # Reused for every tile
+
+    for r0 in range(0,height,nRows):
+
+        r1 = min(r0+nRows,height)
+        t = tile[:,:r1-r0]
+
+        k = 0
+        for i,c in enumerate(cubes):                    # Read one tile of rows from each cube
+            t[k:k+len(c)] = c[:,r0:r1]
+            if isinstance(offset,list):
+                t[k:k+len(c)] -= offset[i][r0:r1]
+            k += len(c)
+
+        if offset is not None and not isinstance(offset,list):
+            t -= offset[r0:r1]
+        if frameScale is not None:
+            t *= frameScale
+
+        for it in range(nIter):
+
+            center = np.nanmedian(t,axis=0)
+            dev = np.abs(t-center)
+            sigma = 1.4826*np.nanmedian(dev,axis=0)     # Robust: one big outlier does not inflate it
+            zero = sigma == 0                           # Fewer than half the values differ (integer data)
+            if zero.any():
+                sigma[zero] = 1.2533*np.nanmean(dev[:,zero],axis=0)     # Mean absolute deviation instead
+
+            with np.errstate(invalid='ignore'):         # Comparisons with NaN (already rejected)
+                bad = dev > nSigma*sigma
+
+            if not bad.any():
+                break
+            t[bad] = np.nan                             # Rejected values are ignored from now on
+
+        result[r0:r1] = combine(t,axis=0)
+
+    return result
+
+#--------------------------------------------------------------------------------------------
+
+def Master_Bias(fNames,**kwargs):
+
+    '''
+        Master bias: the clipped mean of all frames of the given bias cubes.
+        kwargs are passed on to Clipped_Combine.
+    '''
+
+    return Clipped_Combine(fNames,**kwargs)
+
+#--------------------------------------------------------------------------------------------
+
+def Master_Dark(fNames,expTimes,bias,**kwargs):
+
+    '''
+        Dark rate map: (frame - bias)/expTime, combined over all frames of all dark cubes.
+
+            Input:    fNames - dark cubes
+                      expTimes - exposure time of each cube (sec)
+                      bias - master bias
+                      kwargs - passed on to Clipped_Combine
+            Returns:  dark rate (ADU/sec) per pixel
+    '''
+
+    cubes = [FW.Read_Cube(f) for f in fNames]
+    scale = np.concatenate([np.full(len(c),1.0/t) for c,t in zip(cubes,expTimes)])
+
+    return Clipped_Combine(cubes,frameScale=scale,offset=bias,**kwargs)
+
+#--------------------------------------------------------------------------------------------
+
+def Master_Flat(fNames,bias,dark=None,expTimes=None,step=4,**kwargs):
+
+    '''
+        Flat field: every frame has the bias (and dark rate times its exposure time)
+        taken off and is scaled to a median of 1, then all frames are combined and the
+        result normalised to a mean of 1. Scaling each frame first allows flats of
+        different illumination levels to be combined.
+
+            Input:    fNames - illuminated cubes
+                      bias - master bias
+                      dark, expTimes - (optional) dark rate and exposure time of each cube (sec)
+                      step - the frame medians are taken on every step-th row and column
+                      kwargs - passed on to Clipped_Combine
+            Returns:  the flat (float32, mean 1)
+    '''
+
+    cubes = [FW.Read_Cube(f) for f in fNames]
+    cubes = [c[np.newaxis] if c.ndim == 2 else c for c in cubes]
+
+    if dark is None:
+        offsets = [bias]*len(cubes)
+    else:
+        offsets = [bias + dark*t for t in expTimes]
+
+    scale = []
+    for c,off in zip(cubes,offsets):
+        sub = off[::step,::step]
+        for frame in c:
+            scale.append(1.0/np.median(frame[::step,::step] - sub))
+
+    flat = Clipped_Combine(cubes,frameScale=scale,offset=offsets,**kwargs)
+
+    flat /= flat.mean()
+
+    return flat
+
+#--------------------------------------------------------------------------------------------
+
+def Save_Masters(fName,bias,dark=None,flat=None):
+
+    '''
+        Writes the master frames to one .npz file (read back with Calibrator.load).
+    '''
+
+    masters = {'bias':bias}
+    if dark is not None:
+        masters['dark'] = dark
+    if flat is not None:
+        masters['flat'] = flat
+
+    np.savez(fName,**masters)
+
+#--------------------------------------------------------------------------------------------
+
+class Calibrator:
+
+    '''
+        Applies the master frames to frames coming off the camera:
+
+            out = (img - bias - dark*expTime) / flat
+
+        bias + dark*expTime is kept for the last exposure time used, and the flat is
+        stored as its inverse, so each frame costs one subtraction and one
+        multiplication, both written into a preallocated float32 array.
+
+            Input:    bias - master bias
+                      dark - (optional) dark rate (ADU/sec)
+                      flat - (optional) flat field; pixels with flat <= 0 are set to 0
+                      mask - (optional) bad-pixel mask (FLIR_BadPix); bad pixels are set
+                             to 0, at no extra cost (they get a 0 in the inverse flat)
+    '''
+
+    def __init__(self,bias,dark=None,flat=None,mask=None):
+
+        self.bias = np.asarray(bias,dtype=np.float32)
+        self.dark = None if dark is None else np.asarray(dark,dtype=np.float32)
+
+        self.invFlat = None
+        if flat is not None:
+            flat = np.asarray(flat,dtype=np.float32)
+            self.invFlat = np.zeros_like(flat)
+            np.divide(1.0,flat,out=self.invFlat,where=flat>0)
+
+        if mask is not None:
+            if self.invFlat is None:
+                self.invFlat = np.ones_like(self.bias)
+            self.invFlat[np.asarray(getattr(mask,'mask',mask),dtype=bool)] = 0.0     # PixelMask or array
+
+        self.region = None        # (y0, y1, x0, x1) of the frames within the full frame
+        self._expTime = None      # Exposure time the offset was made for
+        self._offset = None
+        self._out = None
+
+    @classmethod
+    def load(cls,fName,mask=None):
+
+        ''' Creates a Calibrator from a file written by Save_Masters (and optionally a mask) '''
+
+        with np.load(fName) as f:
+            return cls(f['bias'],f['dark'] if 'dark' in f else None,f['flat'] if 'flat' in f else None,mask)
+
+    def set_region(self,region=None):
+
+        '''
+            Restricts the calibration to a RoI, as returned by FLIR_Utils.Set_Geometry
+            (x, y, width, height; unbinned only), or back to the full frame with None.
+        '''
+
+        if region is None:
+            self.region = None
+        else:
+            x,y,w,h = region
+            self.region = (y,y+h,x,x+w)
+
+        self._expTime = None      # Offset has to be cut out again
+
+    def _cut(self,arr):
+
+        if arr is None or self.region is None:
+            return arr
+
+        y0,y1,x0,x1 = self.region
+        return arr[y0:y1,x0:x1]
+
+    def apply(self,img,expTime=0.0,out=None):
+
+        '''
+            Calibrates a frame (or each frame of a cube).
+
+                Input:    img - the raw frame(s)
+                          expTime - exposure time (sec), for the dark
+                          out - (optional) float32 array to write into. Otherwise an internal
+                                array is used, which is overwritten by the next call.
+                Returns:  the calibrated frame(s)
+        '''
+
+        if self._expTime != expTime or self._offset is None:
+            self._offset = self._cut(self.bias).copy()
+            if self.dark is not None:
+                self._offset += self._cut(self.dark)*np.float32(expTime)
+            self._expTime = expTime
+            self._invFlat = self._cut(self.invFlat)
+
+        if out is None:
+            if self._out is None or self._out.shape != img.shape:
+                self._out = np.empty(img.shape,dtype=np.float32)
+            out = self._out
+
+        np.subtract(img,self._offset,out=out)
+        if self._invFlat is not None:
+            np.multiply(out,self._invFlat,out=out)
+
+        return out
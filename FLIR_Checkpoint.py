@@ -0,0 +1,193 @@
+'''
+    Checkpoints for CharFLIR runs, so an interrupted run carries on where it stopped
+    instead of starting again from the top.
+
+        File_Checksum   - SHA-256 of a file, read in blocks
+           Checkpoint   - Append-only record of the completed script lines, with the
+                          checksums of their files
+
+    The state file (<sCroot>_state.jsonl) gets one JSON line per completed script line:
+    the name, the files written with their sizes and checksums (FLIR_Writer works them out
+    as it writes the files), and the log line. Each line is written in one go and synced
+    to disk, and carries a CRC of itself, so a line cut short by a crash is recognised and
+    ignored (the script line is then simply run again).
+
+    A script line is complete once all of its files are on disk (FLIR_Writer writes them
+    atomically and calls file_written()) and its log line is known (set_log()), in either
+    order. Only then is it recorded, and then the log line handed to onComplete. Log lines
+    may therefore come out of order when several writer threads are used. Lines whose
+    files failed to write never complete: pending() lists them at the end of the run.
+
+'''
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+#--------------------------------------------------------------------------------------------
+
+def File_Checksum(fName,blockSize=1<<20):
+
+    ''' SHA-256 (hex) of the contents of fName '''
+
+    h = hashlib.sha256()
+    with open(fName,"rb") as f:
+        for block in iter(lambda: f.read(blockSize),b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+#--------------------------------------------------------------------------------------------
+
+class Checkpoint:
+
+    '''
+        Run state of a script: which lines are complete, and with what files.
+
+            Input:    fName - state file (created if not there, appended to otherwise)
+                      onComplete - (optional) called with the log line of each line as it
+                                   completes (e.g. to write it to the log file)
+                      checksums - whether to record the SHA-256 of every file written
+
+        Typical use (see CharFLIR):
+
+            ck = Checkpoint(sCroot+'_state.jsonl',writeLog)
+            todo = [s for s in steps if not ck.is_done(s.fName)]
+            for step in todo:
+                ...
+                ck.expect(step.fName,2)                                   # Cube and _meta
+                writer.submit(step.fName,cube,done=lambda f,c,n=step.fName: ck.file_written(n,f,c))
+                writer.submit(step.fName+"_meta",meta,'npy',done=...)
+                ck.set_log(step.fName,logLine)
+    '''
+
+    def __init__(self,fName,onComplete=None,checksums=True):
+
+        self.fName = fName
+        self.onComplete = onComplete
+        self.checksums = checksums
+        self.done = {}               # name -> record, for the completed lines
+        self._pending = {}           # name -> {'nFiles', 'files', 'log'} until complete
+        self._lock = threading.Lock()
+
+        if os.path.exists(fName):
+            with open(fName,"r") as f:
+                for line in f:
+                    record = self._decode(line)
+                    if record is not None:
+                        self.done[record['name']] = record
+                    if not line.endswith("\n"):    # Cut short: end it, so the next record starts on a line of its own
+                        with open(fName,"a") as g:
+                            g.write("\n")
+
+    @staticmethod
+    def _decode(line):
+
+        ''' The record in one line of the state file, or None if it is damaged '''
+
+        try:
+            entry = json.loads(line)
+            body = json.dumps(entry['record'],sort_keys=True)
+            if zlib.crc32(body.encode()) != entry['crc']:
+                return None
+            return entry['record']
+        except (ValueError,KeyError,TypeError):
+            return None
+
+    def is_done(self,name,verify=False):
+
+        '''
+            Whether script line name completed in an earlier run, with all its files still
+            there and the same size. With verify=True the checksums, where recorded, are
+            checked as well (reads every file back, so takes longer).
+        '''
+
+        record = self.done.get(name)
+        if record is None:
+            return False
+
+        for fileName,(size,checksum) in record['files'].items():
+            if not os.path.exists(fileName) or os.path.getsize(fileName) != size:
+                return False
+            if verify and checksum is not None and File_Checksum(fileName) != checksum:
+                return False
+
+        return True
+
+    def expect(self,name,nFiles):
+
+        ''' Starts a script line that will write nFiles files '''
+
+        with self._lock:
+            self._pending[name] = {'nFiles':nFiles, 'files':{}, 'log':None}
+
+    def file_written(self,name,fileName,checksum=None):
+
+        '''
+            One of the files of script line name is complete on disk (a CubeWriter
+            callback, which passes the checksum). Without a checksum the file is read back
+            to get one.
+        '''
+
+        if not self.checksums:
+            checksum = None
+        elif checksum is None:
+            checksum = File_Checksum(fileName)       # Outside the lock: the slow part
+
+        with self._lock:
+            self._pending[name]['files'][fileName] = (os.path.getsize(fileName),checksum)
+            self._check(name)
+
+    def set_log(self,name,logLine):
+
+        ''' The log line of script line name '''
+
+        with self._lock:
+            self._pending[name]['log'] = logLine
+            self._check(name)
+
+    def pending(self):
+
+        ''' Names of the script lines started (expect()) but not complete '''
+
+        with self._lock:
+            return list(self._pending)
+
+    def _check(self,name):
+
+        ''' Records script line name if it is complete (call with the lock held) '''
+
+        state = self._pending[name]
+        if state['log'] is None or len(state['files']) < state['nFiles']:
+            return
+
+        record = {'name':name, 'files':state['files'], 'log':state['log'], 'time':time.time()}
+        body = json.dumps(record,sort_keys=True)
+
+        with open(self.fName,"a") as f:           # One line, written in one go and synced
+            f.write(json.dumps({'record':record, 'crc':zlib.crc32(body.encode())})+"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.done[name] = json.loads(body)        # As it reads back (tuples as lists)
+        del self._pending[name]
+
+        if self.onComplete is not None:
+            self.onComplete(state['log'])
+
+    def missing_logs(self,logFile):
+
+        '''
+            Log lines of completed script lines that are not in logFile (a crash between
+            recording a line and logging it), in the order they were recorded.
+        '''
+
+        logged = set()
+        if os.path.exists(logFile):
+            with open(logFile,"r") as f:
+                logged = set(f.read().splitlines())
+
+        return [r['log'] for r in sorted(self.done.values(),key=lambda r: r['time']) if r['log'] not in logged]
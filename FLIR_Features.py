@@ -0,0 +1,127 @@
+'''
+    Cached access to camera features, to cut down on GenICam round trips.
+
+         FeatureCache   - Reads static features once, the rest with a time-to-live; snapshot() returns them all
+
+    Every cam.get_* / dev.get_*_feature_value call is a register read over GigE. Status
+    printouts used to read the same unchanging values (sensor size, vendor, bounds, ...)
+    every time. Features are split into three groups:
+
+        static    - fixed for the camera (vendor, model, sensor size, gain bounds, formats).
+                    Read once per connection.
+        settings  - only change when we write them (RoI, pixel format, exposure, gain, ...),
+                    including the frame rate and exposure time bounds, which follow from
+                    the RoI, binning, exposure and frame rate settings. Re-read after
+                    settingsTtl seconds, or after invalidate().
+        volatile  - change by themselves (temperature, supply voltage and current).
+                    Re-read after ttl seconds.
+
+'''
+
+import time
+
+import gi           # To ensure correct Aravis version
+gi.require_version('Aravis', '0.8')     # Version check
+from gi.repository import Aravis        # Aravis package
+
+#--------------------------------------------------------------------------------------------
+
+# name : (group, function of (cam, dev) that reads it)
+
+FEATURES = {
+    'vendor'          : ('static',   lambda cam,dev: cam.get_vendor_name()),
+    'model'           : ('static',   lambda cam,dev: cam.get_model_name()),
+    'deviceId'        : ('static',   lambda cam,dev: cam.get_device_id()),
+    'sensorSize'      : ('static',   lambda cam,dev: tuple(cam.get_sensor_size())),
+    'availableFormats': ('static',   lambda cam,dev: cam.dup_available_pixel_formats_as_display_names()),
+    'gainBounds'      : ('static',   lambda cam,dev: tuple(cam.get_gain_bounds())),
+
+    'region'          : ('settings', lambda cam,dev: tuple(cam.get_region())),
+    'pixelFormat'     : ('settings', lambda cam,dev: cam.get_pixel_format_as_string()),
+    'payload'         : ('settings', lambda cam,dev: cam.get_payload()),
+    'frameRate'       : ('settings', lambda cam,dev: cam.get_frame_rate()),
+    'expTime'         : ('settings', lambda cam,dev: cam.get_exposure_time()/1.0E6),
+    'gain'            : ('settings', lambda cam,dev: cam.get_gain()),
+    'gainConv'        : ('settings', lambda cam,dev: cam.get_string('GainConversion')),
+    'gammaEnable'     : ('settings', lambda cam,dev: cam.get_boolean('GammaEnable')),
+    'gamma'           : ('settings', lambda cam,dev: cam.get_float('Gamma')),
+    'acquisitionMode' : ('settings', lambda cam,dev: Aravis.acquisition_mode_to_string(cam.get_acquisition_mode())),
+    'frameRateBounds' : ('settings', lambda cam,dev: tuple(cam.get_frame_rate_bounds())),
+    'expTimeBounds'   : ('settings', lambda cam,dev: tuple(cam.get_exposure_time_bounds())),
+
+    'volts'           : ('volatile', lambda cam,dev: cam.get_float('PowerSupplyVoltage')),
+    'current'         : ('volatile', lambda cam,dev: cam.get_float('PowerSupplyCurrent')),
+    'temperature'     : ('volatile', lambda cam,dev: dev.get_float_feature_value('DeviceTemperature')),
+}
+
+#--------------------------------------------------------------------------------------------
+
+class FeatureCache:
+
+    '''
+        Caches the camera features listed in FEATURES.
+
+            Input:    cam, dev - as returned by FLIR_Utils.Setup_Camera
+                      ttl - seconds before volatile features are read again
+                      settingsTtl - seconds before settings are read again (None = until invalidated)
+    '''
+
+    def __init__(self,cam,dev,ttl=1.0,settingsTtl=None):
+
+        self.cam = cam
+        self.dev = dev
+        self.ttl = {'static':None, 'settings':settingsTtl, 'volatile':ttl}
+        self._values = {}       # name -> (value, time read)
+
+    def get(self,name):
+
+        '''
+            Returns the value of a single feature, reading it from the camera only if it
+            has not been read yet or has gone stale.
+        '''
+
+        group,reader = FEATURES[name]
+        ttl = self.ttl[group]
+
+        if name in self._values:
+            value,when = self._values[name]
+            if ttl is None or time.monotonic() - when < ttl:
+                return value
+
+        value = reader(self.cam,self.dev)
+        self._values[name] = (value,time.monotonic())
+
+        return value
+
+    def power(self):
+
+        ''' volts, current, power, temperature (as FLIR_Utils.FLIR_Power) '''
+
+        volts,current = self.get('volts'),self.get('current')
+
+        return volts,current,volts*current,self.get('temperature')
+
+    def snapshot(self,groups=('static','settings','volatile')):
+
+        '''
+            Returns a dict of all features in the given groups (plus 'power' if the
+            volatile group is included). Only stale values are read from the camera.
+        '''
+
+        snap = {name:self.get(name) for name,(group,reader) in FEATURES.items() if group in groups}
+
+        if 'volatile' in groups:
+            snap['power'] = snap['volts']*snap['current']
+
+        return snap
+
+    def invalidate(self,groups=('settings','volatile')):
+
+        '''
+            Forgets cached values, so they are read again next time. Call this after
+            changing settings, or with all three groups after a reset or reconnect.
+        '''
+
+        for name in list(self._values):
+            if FEATURES[name][0] in groups:
+                del self._values[name]
@@ -29,36 +29,7 @@ from gi.repository import Aravis
 cam,dev = FU.Setup_Camera(verbose,False)    # Instantiate camera and dev
 FU.Standard_Settings(cam,dev,verbose)       # Standard settings (full frame, etc.)
 
-[fullWidth,fullHeight] = cam.get_sensor_size()    # Full frame size
-[x,y,width,height] = cam.get_region()             # Get RoI details
-payload = cam.get_payload()                       # Get "payload", the size of in bytes
-
-
-print("Camera vendor : %s" %(cam.get_vendor_name()))
-print("Camera model  : %s" %(cam.get_model_name()))
-print("Camera id     : %s" %(cam.get_device_id()))
-print("Pixel format  : %s" %(cam.get_pixel_format_as_string()))
-
-print ("")
-print("Full Frame is : %dx%d "%(fullWidth,fullHeight))
-print("ROI           : %dx%d at %d,%d" %(width, height, x, y))
-print("Pixel format  : %s" %(cam.get_pixel_format_as_string()))
-print("Frame size     : %d  Bytes" %(payload))
-
-print ("")
-print("Framerate     : %s Hz" %(cam.get_frame_rate()))
-print("Exposure time : %s seconds " %(cam.get_exposure_time()/1.0E6))
-print("Gain Conv.    : ",cam.get_string('GainConversion'))
-print("Gamma enable  : ",cam.get_boolean('GammaEnable'))
-print("Gamma value   : ",cam.get_float('Gamma'))
-
-print("")
-print ("Available Formats : ",cam.dup_available_pixel_formats_as_display_names ())
-print ("acquisition_mode ",Aravis.acquisition_mode_to_string(cam.get_acquisition_mode()))
-print ("framerate bounds ",cam.get_frame_rate_bounds())
-print ("Exp. Time bounds ",cam.get_exposure_time_bounds())
-print ("Gain bounds      ",cam.get_gain_bounds())
-print ("")
+FU.FLIR_Status(cam,dev)                     # Print out camera info (each feature read once)
 
 print ("BlackLevelSelector ",cam.get_string('BlackLevelSelector'))
 
@@ -0,0 +1,204 @@
+'''
+    Running all the AG cameras on one host together.
+
+        CameraManager   - Opens every camera found, sets them up and acquires from all of them at once
+
+    Each camera gets its own worker thread, which runs FLIR_Utils.Iter_Frames in streaming
+    mode, converting the frames into a cube of its own, and hands them over through a
+    per-camera queue that never makes the worker wait. The Aravis calls release the
+    GIL while they wait for data, so the cameras run concurrently and per-camera throughput
+    is limited by the network link, not by the number of cameras.
+
+    Typical use:
+
+        mgr = CameraManager(verbose)
+        mgr.tune_network()
+        mgr.standard_settings()
+        streams = mgr.iter_frames(10,sync=True)
+        for devId in streams:
+            for img,meta in streams[devId]:
+                ...
+
+'''
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import gi           # To ensure correct Aravis version
+gi.require_version('Aravis', '0.8')     # Version check
+from gi.repository import Aravis        # Aravis package
+
+import FLIR_Utils as FU      # All the camera interface stuff
+
+_END = object()     # Marks the end of a camera's frame stream
+
+#--------------------------------------------------------------------------------------------
+
+class CameraManager:
+
+    '''
+        Finds and opens every camera (Aravis.get_n_devices()), keyed by device id.
+
+            Input:    verbose - how wordy to be
+                      fakeCam - also enable the Aravis fake camera interface
+
+        self.cams is a dict of device id -> (cam, dev), in the order they were found.
+    '''
+
+    def __init__(self,verbose=False,fakeCam=False):
+
+        self.verbose = verbose
+
+        if fakeCam:
+            Aravis.enable_interface("Fake")     # using arv-fake-gv-camera-0.8
+
+        Aravis.update_device_list()             # Scan for live cameras
+
+        self.cams = {}
+        for i in range(Aravis.get_n_devices()):
+
+            devId = Aravis.get_device_id(i)
+            try:
+                cam = Aravis.Camera.new(devId)      # Instantiate cam
+            except Exception as err:
+                print ("ERROR - Could not open camera ",devId," : ",err)
+                continue
+
+            self.cams[devId] = (cam,cam.get_device())
+
+            if verbose:
+                print ("Instantiated camera ",devId)
+
+        if not self.cams:
+            print ("ERROR - No camera found")
+
+    def __len__(self):
+
+        return len(self.cams)
+
+    def run_all(self,func):
+
+        '''
+            Calls func(cam,dev) on every camera in parallel (e.g. to set gain and exposure
+            time) and returns a dict of device id -> result. Exceptions are re-raised here.
+        '''
+
+        if not self.cams:
+            return {}
+
+        with ThreadPoolExecutor(len(self.cams)) as pool:
+            futures = {devId:pool.submit(func,cam,dev) for devId,(cam,dev) in self.cams.items()}
+            return {devId:f.result() for devId,f in futures.items()}
+
+    def tune_network(self):
+
+        '''
+            Applies FLIR_Utils.Tune_Network to all cameras, sharing the link bandwidth
+            between them. Returns a dict of device id -> the network settings.
+        '''
+
+        nCameras = len(self.cams)
+
+        return self.run_all(lambda cam,dev: FU.Tune_Network(cam,dev,nCameras,self.verbose))
+
+    def standard_settings(self,pixelFormat=None):
+
+        '''
+            Applies FLIR_Utils.Standard_Settings to all cameras in parallel (pixelFormat
+            e.g. 'Mono12p' to get more cameras onto one link).
+        '''
+
+        return self.run_all(lambda cam,dev: FU.Standard_Settings(cam,dev,self.verbose,pixelFormat=pixelFormat))
+
+    def iter_frames(self,nFrames,sync=False,**kwargs):
+
+        '''
+            Starts an acquisition of nFrames frames on every camera and returns a dict
+            of device id -> generator yielding (img, meta), as FLIR_Utils.Iter_Frames.
+
+            Input:    nFrames - frames per camera
+                      sync - if True, all cameras start together (the workers wait for
+                             each other before starting); otherwise each starts at once
+                      kwargs - passed on to FLIR_Utils.Iter_Frames (streaming is forced on)
+
+            Each camera converts its frames into an (nFrames, H, W) cube allocated up front
+            (FLIR_Utils.New_Cube), and the generator yields the frames of that cube. The
+            workers never wait for the consumer, so the streams can be consumed in any order
+            (e.g. one camera after another) or from different threads without losing frames,
+            at the cost of holding up to nFrames frames per camera. An error in a camera's worker is
+            re-raised from that camera's generator. If a generator is given up (break, or an
+            exception in the consumer), its camera's acquisition is stopped.
+        '''
+
+        kwargs['streaming'] = True
+        kwargs.pop('out',None)            # Each camera has its own cube
+        barrier = threading.Barrier(len(self.cams)) if sync and self.cams else None
+
+        streams = {}
+        for devId,(cam,dev) in self.cams.items():
+
+            frameQueue = queue.Queue()        # Unbounded: the cube holds the frames themselves
+            stop = threading.Event()          # Set when the consumer gives up
+            t = threading.Thread(target=self._worker,args=(cam,nFrames,barrier,frameQueue,stop,kwargs),
+                                 name="Camera-"+devId,daemon=True)
+            t.start()
+            streams[devId] = self._consume(frameQueue,stop)
+
+        return streams
+
+    def acquire(self,nFrames,sync=False,**kwargs):
+
+        '''
+            Acquires nFrames frames on all cameras concurrently and returns a dict of
+            device id -> (nFrames, H, W) cube (2D if nFrames=1), as FLIR_Utils.Acquire_Frames.
+        '''
+
+        kwargs.pop('streaming',None)      # Always streaming
+
+        def grab(cam,dev):
+            return FU.Acquire_Frames(cam,nFrames,verbose=self.verbose,streaming=True,**kwargs)
+
+        if not sync or not self.cams:
+            return self.run_all(grab)
+
+        barrier = threading.Barrier(len(self.cams))
+
+        def syncGrab(cam,dev):
+            barrier.wait()
+            return grab(cam,dev)
+
+        return self.run_all(syncGrab)
+
+    @staticmethod
+    def _worker(cam,nFrames,barrier,frameQueue,stop,kwargs):
+
+        try:
+            if barrier is not None:
+                barrier.wait()        # Everyone starts together
+            cube = FU.New_Cube(cam,nFrames)   # Frame k is converted into cube[k], so no frame is overwritten
+            frames = FU.Iter_Frames(cam,nFrames,out=cube,**kwargs)
+            try:
+                for item in frames:
+                    if stop.is_set():
+                        break         # Nobody listening any more
+                    frameQueue.put(item)
+            finally:
+                frames.close()        # Stops the acquisition (Iter_Frames' finally)
+            frameQueue.put(_END)
+        except Exception as err:
+            frameQueue.put(err)
+
+    @staticmethod
+    def _consume(frameQueue,stop):
+
+        try:
+            while True:
+                item = frameQueue.get()
+                if item is _END:
+                    return
+                if isinstance(item,Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()                # Lets the worker stop its camera if we gave up early
@@ -0,0 +1,277 @@
+'''
+    Photon transfer curve (PTC) analysis of a whole CharFLIR run.
+
+         Analyse_File   - Mean and difference-image variance of one cube, overall and per region
+       Analyse_Script   - Analyses all cubes of a script in parallel, with an mtime cache
+              Fit_PTC   - Conversion gain, read noise, full well and linearity of one gain setting
+          Write_Table   - Writes the fit results (one line per GainConversion and gain) as text
+
+    The variance is taken from differences of consecutive frames (1-2, 3-4, ...), divided
+    by 2, which removes fixed-pattern noise. The cubes are analysed in a pool of processes,
+    one cube per process. A .npy cube is read memory-mapped, one pair of frames at a time;
+    .npz and .fla cubes are decompressed whole first (FLIR_Writer.Read_Cube). The results per cube
+    are kept in a cache file (JSON) along with the cube's mtime and size, so a re-run only
+    analyses new or changed cubes.
+
+    Run it as:
+
+        python FLIR_PTC.py MV_Feb13_2 [BadPix.npz]    (reads MV_Feb13_2.txt, writes MV_Feb13_2_ptc.txt)
+
+'''
+
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import FLIR_Writer as FW     # Reading the cubes back
+import FLIR_BadPix as FB     # Bad-pixel masks
+import FLIR_Plan as FL       # Reading the script
+
+#--------------------------------------------------------------------------------------------
+
+def Analyse_File(fName,grid=(4,4),maskFile=None):
+
+    '''
+        Analyses one cube.
+
+            Input:    fName - cube file name (as in the script; see FLIR_Writer.Read_Cube)
+                      grid - number of regions down and across the frame
+                      maskFile - (optional) bad-pixel mask (FLIR_BadPix.Save_Mask) of pixels
+                                 to leave out
+            Returns:  dict with 'mean' and 'variance' (difference-image variance / 2, NaN
+                      if there are fewer than two frames) for the whole frame, and
+                      'regionMean' and 'regionVariance', the same per region (grid lists)
+    '''
+
+    cube = FW.Read_Cube(fName)
+    if cube.ndim == 2:
+        cube = cube[np.newaxis]
+
+    nFrames,height,width = cube.shape
+    gy,gx = grid                                  # (edges beyond the grid are left out)
+
+    mask = FB.PixelMask(FB.Load_Mask(maskFile)) if maskFile else FB.PixelMask(np.zeros((height,width),dtype=bool))
+
+    def regions(img,out):                         # Per-region means of img, into out
+        out[...] = mask.grid_mean(img,grid)
+
+    sumMap = np.zeros((gy,gx))
+    regionVar = np.zeros((gy,gx))
+    dMean,work = np.empty((gy,gx)),np.empty((gy,gx))
+    total = 0.0
+    diff = np.empty((height,width),dtype=np.float32)
+
+    for k in range(nFrames):
+        frame = cube[k]
+        total += mask.mean(frame)
+        regions(frame,work)
+        sumMap += work
+
+    nPairs = nFrames//2
+    diffVar = []
+    for k in range(nPairs):
+        np.subtract(cube[2*k+1],cube[2*k],out=diff,dtype=np.float32)
+        m = mask.mean(diff)
+        regions(diff,dMean)
+        np.square(diff,out=diff)
+        diffVar.append((mask.mean(diff) - m*m)/2.0)
+        regions(diff,work)
+        regionVar += (work - dMean*dMean)/2.0    # Per-region var(diff)/2 of this pair
+
+    if nPairs:
+        regionVar /= nPairs                      # Averaged over pairs, as the whole-frame variance
+    else:
+        regionVar.fill(np.nan)
+
+    return {'mean'           : total/nFrames,
+            'variance'       : float(np.mean(diffVar)) if diffVar else float('nan'),
+            'regionMean'     : (sumMap/nFrames).tolist(),
+            'regionVariance' : regionVar.tolist(),
+            'nFrames'        : nFrames}
+
+#--------------------------------------------------------------------------------------------
+
+def _analyse(args):
+
+    ''' Worker for Analyse_Script: one cube in a separate process '''
+
+    fName,grid,maskFile = args
+
+    try:
+        return Analyse_File(fName,grid,maskFile)
+    except Exception as err:
+        return {'error':str(err)}
+
+def _file_id(fName):
+
+    ''' mtime and size of the file the cube is actually stored in, or None '''
+
+    for f in [FW.Cube_File(fName,fmt) for fmt in ('npy','npz','fla')]+[fName]:    # As Read_Cube looks for it
+        if os.path.exists(f):
+            st = os.stat(f)
+            return [st.st_mtime,st.st_size]
+
+    return None
+
+#--------------------------------------------------------------------------------------------
+
+def Analyse_Script(scriptFile,cacheFile=None,grid=(4,4),maskFile=None,nProcs=None,verbose=False):
+
+    '''
+        Analyses every cube of a CharFLIR script.
+
+            Input:    scriptFile - the script file
+                      cacheFile - results cache (default: script root + "_ptc_cache.json")
+                      grid - regions per frame, as Analyse_File
+                      maskFile - (optional) bad-pixel mask, as Analyse_File
+                      nProcs - processes to use (default: one per CPU)
+                      verbose - how wordy to be
+            Returns:  list of (step, result), step as FLIR_Plan.Read_Script and result as Analyse_File,
+                      for the cubes that exist
+    '''
+
+    if cacheFile is None:
+        cacheFile = os.path.splitext(scriptFile)[0]+"_ptc_cache.json"
+
+    cache = {}
+    if os.path.exists(cacheFile):
+        with open(cacheFile,"r") as f:
+            cache = json.load(f)
+
+    steps = [s for s in FL.Read_Script(scriptFile) if _file_id(s[0]) is not None]
+
+    maskId = [maskFile,_file_id(maskFile)] if maskFile else None     # A new mask means analysing again
+
+    todo = [s[0] for s in steps if cache.get(s[0],{}).get('id') != _file_id(s[0])
+                                or cache[s[0]].get('grid') != list(grid)
+                                or cache[s[0]].get('mask') != maskId]
+
+    if verbose:
+        print ("Analysing ",len(todo)," of ",len(steps)," cubes (the rest from ",cacheFile,")")
+
+    if todo:
+        with ProcessPoolExecutor(nProcs) as pool:
+            for fName,result in zip(todo,pool.map(_analyse,[(f,grid,maskFile) for f in todo])):
+                if 'error' in result:
+                    print ("ERROR - Could not analyse ",fName," : ",result['error'])
+                    continue
+                cache[fName] = {'id':_file_id(fName), 'grid':list(grid), 'mask':maskId, 'result':result}
+                if verbose:
+                    print ("  ",fName,"  mean ","{:.2f}".format(result['mean']),
+                           "  variance ","{:.3f}".format(result['variance']))
+
+        tmpName = cacheFile+".tmp"
+        with open(tmpName,"w") as f:
+            json.dump(cache,f)
+        os.replace(tmpName,cacheFile)
+
+    return [(s,cache[s[0]]['result']) for s in steps if s[0] in cache]
+
+#--------------------------------------------------------------------------------------------
+
+def Fit_PTC(expTimes,means,variances,offset=None,linFrac=0.8):
+
+    '''
+        Fits the photon transfer curve of one GainConversion/gain setting:
+
+            variance = signal/K + readNoise^2      (all in ADU, signal = mean - offset)
+
+            Input:    expTimes, means, variances - one value per cube
+                      offset - bias level (ADU); default: the mean of the shortest exposure
+                      linFrac - linearity is measured up to this fraction of the full well
+            Returns:  dict with gain (e-/ADU), readNoise (e-), fullWell (e-, the signal at
+                      which the variance peaks, i.e. where saturation starts),
+                      nonLinearity (largest deviation from a straight line through the origin
+                      of signal against exposure time, as a fraction), and nPoints used
+    '''
+
+    order = np.argsort(expTimes)
+    expTimes = np.asarray(expTimes,dtype=float)[order]
+    means = np.asarray(means,dtype=float)[order]
+    variances = np.asarray(variances,dtype=float)[order]
+
+    ok = np.isfinite(variances)
+    expTimes,means,variances = expTimes[ok],means[ok],variances[ok]
+
+    nan = float('nan')
+    fit = {'gain':nan, 'readNoise':nan, 'fullWell':nan, 'nonLinearity':nan, 'nPoints':len(means)}
+
+    if len(means) < 3:
+        return fit
+
+    if offset is None:
+        offset = means[0]
+    signal = means - offset
+
+    peak = int(np.argmax(variances))            # Past this, the variance falls: saturation
+    use = slice(0,peak+1) if peak >= 2 else slice(None)
+
+    slope,intercept = np.polyfit(signal[use],variances[use],1)
+    if slope <= 0:
+        return fit
+
+    gain = 1.0/slope
+    fit.update({'gain'        : gain,
+                'readNoise'   : np.sqrt(max(intercept,0.0))*gain,
+                'fullWell'    : signal[peak]*gain,
+                'nPoints'     : len(signal[use])})
+
+    lin = (signal > 0) & (signal <= linFrac*signal[peak])
+    if lin.sum() >= 2:
+        rate = np.sum(signal[lin]*expTimes[lin])/np.sum(expTimes[lin]**2)     # Least squares, through 0
+        fit['nonLinearity'] = float(np.max(np.abs(signal[lin]/(rate*expTimes[lin]) - 1.0)))
+
+    return fit
+
+#--------------------------------------------------------------------------------------------
+
+def Write_Table(fName,results):
+
+    '''
+        Fits each GainConversion/gain setting of Analyse_Script's results and writes
+        one line per setting to fName. Also fits each region separately and gives the
+        spread (standard deviation / mean) of the region gains. Returns the table rows.
+    '''
+
+    groups = {}
+    for step,result in results:
+        groups.setdefault((step[1],step[2]),[]).append((step[3]/1.0E6,result))
+
+    rows = []
+    for (gainConv,gain),points in sorted(groups.items()):
+
+        expTimes = [p[0] for p in points]
+        fit = Fit_PTC(expTimes,[p[1]['mean'] for p in points],[p[1]['variance'] for p in points])
+
+        regionMeans = np.array([p[1]['regionMean'] for p in points])
+        regionVars = np.array([p[1]['regionVariance'] for p in points])
+        gains = [Fit_PTC(expTimes,regionMeans[:,i,j],regionVars[:,i,j])['gain']
+                 for i in range(regionMeans.shape[1]) for j in range(regionMeans.shape[2])]
+        spread = np.nanstd(gains)/np.nanmean(gains) if np.isfinite(gains).any() else float('nan')
+
+        rows.append((gainConv,gain,fit['gain'],fit['readNoise'],fit['fullWell'],fit['nonLinearity'],spread,fit['nPoints']))
+
+    with open(fName,"w") as outFile:
+        outFile.write("GainMode  Gain  K(e/ADU)  ReadNoise(e)  FullWell(e)  NonLinearity  GainSpread  nPoints\n")
+        for row in rows:
+            outFile.write(row[0] +" "+ str(row[1]) +" "+ " ".join("{:.4e}".format(v) for v in row[2:7]) +" "+ str(row[7]) +"\n")
+
+    return rows
+
+#--------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    sCroot = sys.argv[1] if len(sys.argv) > 1 else 'MV_Feb13_2'      # File root of the CharFLIR run
+    maskFile = sys.argv[2] if len(sys.argv) > 2 else None              # Bad-pixel mask, if any
+
+    results = Analyse_Script(sCroot+'.txt',maskFile=maskFile,verbose=True)
+    rows = Write_Table(sCroot+'_ptc.txt',results)
+
+    print ("")
+    for row in rows:
+        print ("  ",row[0]," gain ",row[1],"  K ","{:.3f}".format(row[2])," e/ADU  read noise ",
+               "{:.2f}".format(row[3])," e  full well ","{:.0f}".format(row[4])," e")
@@ -0,0 +1,116 @@
+'''
+    Packing and unpacking of 12-bit pixel data, with numpy only (no camera interface needed).
+
+         Pack_Mono12p   - Packs 12-bit values, two pixels in three bytes (GenICam Mono12p layout)
+       Unpack_Mono12p   - Unpacks Mono12p data back to uint16
+  Unpack_Mono12Packed   - Unpacks Mono12Packed data (GigE Vision layout) to uint16
+
+    Mono12p layout, for pixels p0 and p1:
+
+        byte 0 = p0 bits 0-7
+        byte 1 = p0 bits 8-11 (low nibble), p1 bits 0-3 (high nibble)
+        byte 2 = p1 bits 4-11
+
+    Mono12Packed layout (GigE Vision):
+
+        byte 0 = p0 bits 4-11
+        byte 1 = p0 bits 0-3 (low nibble), p1 bits 0-3 (high nibble)
+        byte 2 = p1 bits 4-11
+
+    An odd number of pixels is padded with one zero pixel.
+
+'''
+
+import numpy as np
+
+#--------------------------------------------------------------------------------------------
+
+def Pack_Mono12p(img):
+
+    '''
+        Packs an array of values 0..4095 (any shape) into Mono12p bytes.
+
+            Input:    img - integer array (values above 4095 are cut to 12 bits)
+            Returns:  1D uint8 array of 3 bytes per 2 pixels
+    '''
+
+    flat = np.ascontiguousarray(img,dtype=np.uint16).reshape(-1)
+    if flat.size % 2:
+        flat = np.append(flat,np.uint16(0))
+
+    p0,p1 = flat[0::2],flat[1::2]
+    packed = np.empty((flat.size//2,3),dtype=np.uint8)
+
+    packed[:,0] = p0 & 0xff
+    packed[:,1] = ((p0 >> 8) & 0x0f) | ((p1 & 0x0f) << 4)
+    packed[:,2] = (p1 >> 4) & 0xff
+
+    return packed.reshape(-1)
+
+#--------------------------------------------------------------------------------------------
+
+def _unpack12(data,shape,out,msbFirst):
+
+    '''
+        Unpacks 3 bytes per 2 pixels straight into out (uint16). msbFirst selects
+        Mono12Packed (bytes 0 and 2 hold the top 8 bits) rather than Mono12p (bytes 0
+        and 2 hold the bottom 8 bits of p0 and top 8 bits of p1).
+    '''
+
+    nPix = int(np.prod(shape))
+    b = np.frombuffer(data,dtype=np.uint8,count=3*((nPix+1)//2)).reshape(-1,3)
+
+    if out is None:
+        out = np.empty(shape,dtype=np.uint16)
+
+    if not out.flags.c_contiguous:          # Not a view we can write through: unpack, then copy
+        out[...] = _unpack12(data,shape,None,msbFirst)
+        return out
+
+    o = out.reshape(-1)
+    even,odd = o[0::2],o[1::2]              # p0 and p1 of each group
+    nEven,nOdd = len(even),len(odd)
+
+    if msbFirst:                            # Mono12Packed
+        even[...] = b[:nEven,0]
+        even <<= 4
+        even |= b[:nEven,1] & 0x0f
+        odd[...] = b[:nOdd,2]
+        odd <<= 4
+        odd |= b[:nOdd,1] >> 4
+    else:                                   # Mono12p
+        even[...] = b[:nEven,1] & 0x0f
+        even <<= 8
+        even |= b[:nEven,0]
+        odd[...] = b[:nOdd,2]
+        odd <<= 4
+        odd |= b[:nOdd,1] >> 4
+
+    return out
+
+#--------------------------------------------------------------------------------------------
+
+def Unpack_Mono12p(data,shape,out=None):
+
+    '''
+        Unpacks Mono12p data, with shifts and masks on the 3-byte groups, written
+        straight into the output array.
+
+            Input:    data - bytes or uint8 array (3 bytes per 2 pixels)
+                      shape - shape of the result
+                      out - (optional) uint16 array of that shape to unpack into
+                            (e.g. one frame of a cube)
+            Returns:  uint16 array
+    '''
+
+    return _unpack12(data,shape,out,False)
+
+#--------------------------------------------------------------------------------------------
+
+def Unpack_Mono12Packed(data,shape,out=None):
+
+    '''
+        Unpacks Mono12Packed data (the older GigE Vision layout), as Unpack_Mono12p.
+    '''
+
+    return _unpack12(data,shape,out,True)
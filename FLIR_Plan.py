@@ -0,0 +1,329 @@
+'''
+    Plans for CharFLIR script files: reading, checking, reordering and timing them, with no
+    camera needed.
+
+          Read_Script   - Reads a script file into a list of Steps
+         Write_Script   - Writes Steps back out as a script file
+          Save_Bounds   - Saves the camera's gain and exposure bounds (FeatureCache) as JSON
+          Load_Bounds   - Reads them back, for planning without the camera
+             Validate   - Checks every step against the bounds
+             Optimise   - Reorders steps to cut gain mode switches and exposure jumps
+             Estimate   - Predicts the run time from exposure, readout, set-up and write costs
+          Pack_Window   - Splits a plan into parts that each fit a time window
+
+    The generators write every LCG line, then every HCG line, with the exposure times going
+    up for each gain, so every gain starts again with a jump from the longest exposure to the
+    shortest. Optimise() keeps each gain mode together and runs the exposures up and down
+    alternately ("serpentine"), so consecutive lines differ as little as possible. The file
+    names do not change, so the results are the same whatever the order (as long as the
+    illumination is steady).
+
+    Estimate() uses the costs in COSTS (override any of them with costs=). Check them against
+    the telemetry of a real run (<sCroot>_telemetry.jsonl, see FLIR_Telemetry) before
+    relying on the totals.
+
+    Run it as:
+
+        python FLIR_Plan.py MV_Feb13.txt [hours]
+
+    to check the script against FLIR_bounds.json (written by CharFLIR), print the estimated
+    run time before and after optimising, and write MV_Feb13_plan.txt, or, given the hours
+    available per run, MV_Feb13_plan_1.txt, MV_Feb13_plan_2.txt, ...
+
+'''
+
+import json
+import math
+import os
+import sys
+from collections import namedtuple
+
+GAIN_MODES = ('HCG','LCG')
+
+# One script line, exposure time in uSec (as CharFLIR uses it). Still a plain 5-tuple, so
+# it unpacks and indexes as the steps always have.
+
+Step = namedtuple('Step','fName gainConv gain expTime nFrames')
+
+# Cost : seconds (writeMBps in MB/s)
+
+COSTS = {'readout'   : 0.1,     # Readout and transfer of one full Mono16 frame
+         'overhead'  : 0.1,     # Start and stop of each single-frame acquisition
+         'start'     : 0.3,     # Start and stop of a streaming acquisition (once per line)
+         'gainConv'  : 1.0,     # Writing GainConversion (the sensor settles afterwards)
+         'gain'      : 0.05,    # Writing the gain
+         'expTime'   : 0.05,    # Writing the exposure time
+         'expJump'   : 0.2,     # Extra per decade of exposure change
+         'writeMBps' : 100.0}   # Write throughput of the data files
+
+#--------------------------------------------------------------------------------------------
+
+def Read_Script(scriptFile):
+
+    '''
+        Reads a CharFLIR script file. Blank lines and lines starting with # are left out.
+
+            Input:    scriptFile - file name
+            Returns:  list of Steps (fName, gainConv, gain, expTime, nFrames), exposure
+                      time in uSec
+    '''
+
+    steps = []
+    with open(scriptFile,"r") as inFile:
+        for line in inFile.read().splitlines():
+            if line.strip() and line[0]!="#":   # Ignore comment lines, if any
+                vals = line.split()
+                steps.append(Step(vals[0],vals[1],float(vals[2]),float(vals[3]),int(vals[4])))
+
+    return steps
+
+#--------------------------------------------------------------------------------------------
+
+def Write_Script(scriptFile,steps):
+
+    ''' Writes steps as a script file, in the format of WriteTestScript.py '''
+
+    with open(scriptFile,"w") as outFile:
+        for fName,gainConv,gain,expTime,nFrames in steps:
+            outFile.write(fName +" "+ gainConv +" "+ str(gain) +" "+ "{:.3e}".format(expTime) +" "+ str(nFrames) +"\n")
+
+#--------------------------------------------------------------------------------------------
+
+def Save_Bounds(fName,bounds):
+
+    '''
+        Saves the static camera features (e.g. FeatureCache(cam,dev).snapshot(('static',)))
+        and the exposure time bounds (expTimeBounds, read with the frame rate settings the
+        run will use) as JSON, so scripts can be checked without the camera.
+    '''
+
+    with open(fName,"w") as f:
+        json.dump(bounds,f,indent=1)
+
+def Load_Bounds(fName):
+
+    ''' Reads the bounds saved by Save_Bounds (lists as tuples, as FeatureCache has them) '''
+
+    with open(fName,"r") as f:
+        bounds = json.load(f)
+
+    return {k:(tuple(v) if isinstance(v,list) else v) for k,v in bounds.items()}
+
+#--------------------------------------------------------------------------------------------
+
+def Validate(steps,bounds=None):
+
+    '''
+        Checks the steps: gain mode, gain and exposure time within the camera bounds,
+        at least one frame, and no file name used twice.
+
+            Input:    steps - list of Steps
+                      bounds - (optional) dict with 'gainBounds' and 'expTimeBounds' (uSec),
+                               as FeatureCache or Load_Bounds. Without it only the rest is
+                               checked
+            Returns:  list of problems (strings), empty if there are none
+    '''
+
+    problems = []
+    seen = {}
+
+    gainMin,gainMax = bounds['gainBounds'] if bounds else (-math.inf,math.inf)
+    expMin,expMax = bounds['expTimeBounds'] if bounds else (0.0,math.inf)
+
+    for i,(fName,gainConv,gain,expTime,nFrames) in enumerate(steps):
+
+        where = "step "+str(i+1)+" ("+fName+"): "
+
+        if gainConv not in GAIN_MODES:
+            problems.append(where+"gain mode "+gainConv+" is not one of "+" ".join(GAIN_MODES))
+        if not gainMin <= gain <= gainMax:
+            problems.append(where+"gain "+str(gain)+" is outside "+str(gainMin)+" - "+str(gainMax))
+        if not expMin <= expTime <= expMax:
+            problems.append(where+"exposure time "+str(expTime)+" uSec is outside "+str(expMin)+" - "+str(expMax))
+        if nFrames < 1:
+            problems.append(where+"no frames")
+        if fName in seen:
+            problems.append(where+"same file name as step "+str(seen[fName]+1))
+        seen.setdefault(fName,i)
+
+    return problems
+
+#--------------------------------------------------------------------------------------------
+
+def Optimise(steps,first=None):
+
+    '''
+        Reorders steps so each gain mode is run in one go, the gains go up in one mode and
+        down in the next, and the exposure times go up and down alternately from one gain to
+        the next. Each switch then changes as little as possible.
+
+            Input:    steps - list of Steps
+                      first - (optional) gain mode to start with (e.g. the camera's current
+                              one); otherwise the first in steps
+            Returns:  list of the same Steps, reordered
+    '''
+
+    modes = []
+    for step in steps:
+        if step.gainConv not in modes:
+            modes.append(step.gainConv)
+    if first in modes:
+        modes.remove(first)
+        modes.insert(0,first)
+
+    plan = []
+    up = True          # Direction of the exposure times
+
+    for m,mode in enumerate(modes):
+
+        gains = sorted({s.gain for s in steps if s.gainConv == mode},reverse=(m % 2 == 1))
+
+        for gain in gains:
+            group = sorted((s for s in steps if s.gainConv == mode and s.gain == gain),
+                           key=lambda s: s.expTime,reverse=not up)
+            plan.extend(group)
+            up = not up
+
+    return plan
+
+#--------------------------------------------------------------------------------------------
+
+def _step_costs(prev,step,frameBytes,streaming,frameWait,costs):
+
+    ''' Set-up, acquisition and write time (sec) of step, following prev (None for the first) '''
+
+    fName,gainConv,gain,expTime,nFrames = step
+
+    if prev is None:
+        setup = costs['gainConv'] + costs['gain'] + costs['expTime']
+    else:
+        setup = 0.0
+        if gainConv != prev.gainConv:
+            setup += costs['gainConv']
+        if gain != prev.gain:
+            setup += costs['gain']
+        if expTime != prev.expTime:
+            setup += costs['expTime'] + costs['expJump']*abs(math.log10(max(expTime,1.0)/max(prev.expTime,1.0)))
+
+    t = expTime/1.0E6
+    if streaming:       # Frames as fast as the exposure (or the readout) allows
+        acquire = costs['start'] + nFrames*max(t,costs['readout'])
+    else:               # One frame at a time, frameWait apart
+        acquire = nFrames*(t + costs['readout'] + costs['overhead']) + (nFrames-1)*frameWait
+
+    write = nFrames*frameBytes/1.0E6/costs['writeMBps']
+
+    return setup,acquire,write
+
+def Estimate(steps,frameBytes=0,streaming=True,frameWait=1.0,costs=None):
+
+    '''
+        Predicts how long a plan takes to run in CharFLIR.
+
+            Input:    steps - list of Steps, in the order they will be run
+                      frameBytes - bytes per frame (e.g. cam.get_payload()); 0 leaves the
+                                   writing out
+                      streaming, frameWait - as in CharFLIR
+                      costs - (optional) dict overriding entries of COSTS
+            Returns:  dict with 'total', 'setup', 'acquire' and 'write' (sec), 'switches'
+                      (gain mode changes) and 'perStep' (set-up + acquisition time of each
+                      step). Files are written in the background, so the total is the
+                      longer of the camera time and the write time.
+    '''
+
+    costs = dict(COSTS,**(costs or {}))
+
+    setup = acquire = write = 0.0
+    perStep = []
+    switches = 0
+    prev = None
+
+    for step in steps:
+        s,a,w = _step_costs(prev,step,frameBytes,streaming,frameWait,costs)
+        setup += s
+        acquire += a
+        write += w
+        perStep.append(s+a)
+        if prev is not None and step.gainConv != prev.gainConv:
+            switches += 1
+        prev = step
+
+    return {'total':max(setup+acquire,write), 'setup':setup, 'acquire':acquire, 'write':write,
+            'switches':switches, 'perStep':perStep}
+
+#--------------------------------------------------------------------------------------------
+
+def Pack_Window(steps,window,**kwargs):
+
+    '''
+        Splits steps, in order, into parts that each take no longer than window.
+
+            Input:    steps - list of Steps (e.g. from Optimise)
+                      window - time available per run (sec)
+                      kwargs - passed on to Estimate (frameBytes, streaming, ...)
+            Returns:  list of parts (lists of Steps). A step too long for any window is
+                      given a part of its own
+    '''
+
+    parts = []
+    part = []
+
+    for step in steps:
+        if part and Estimate(part+[step],**kwargs)['total'] > window:
+            parts.append(part)
+            part = []
+        part.append(step)
+
+    if part:
+        parts.append(part)
+
+    return parts
+
+#--------------------------------------------------------------------------------------------
+
+def _hours(sec):
+
+    return "{:.2f}".format(sec/3600.0)+" h"
+
+if __name__ == '__main__':
+
+    scriptFile = sys.argv[1]
+    window = float(sys.argv[2])*3600.0 if len(sys.argv) > 2 else None
+    boundsFile = 'FLIR_bounds.json'    # Written by CharFLIR
+
+    streaming = True        # As in CharFLIR
+    frameWait = 1.0
+
+    steps = Read_Script(scriptFile)
+
+    bounds = Load_Bounds(boundsFile) if os.path.exists(boundsFile) else None
+    if bounds is None:
+        print ("No ",boundsFile,", so gains and exposure times are not checked against the camera")
+
+    problems = Validate(steps,bounds)
+    for problem in problems:
+        print ("ERROR - ",problem)
+    if problems:
+        sys.exit(1)
+
+    frameBytes = 2*bounds['sensorSize'][0]*bounds['sensorSize'][1] if bounds else 0    # Mono16, full frame
+
+    before = Estimate(steps,frameBytes,streaming,frameWait)
+    plan = Optimise(steps)
+    after = Estimate(plan,frameBytes,streaming,frameWait)
+
+    print (len(steps)," steps")
+    print ("As written : ",_hours(before['total']),"  (set-up ",_hours(before['setup']),", ",before['switches']," gain mode switches)")
+    print ("Optimised  : ",_hours(after['total']),"  (set-up ",_hours(after['setup']),", ",after['switches']," gain mode switches)")
+
+    root = os.path.splitext(scriptFile)[0]
+
+    if window is None:
+        Write_Script(root+"_plan.txt",plan)
+        print ("Written to ",root+"_plan.txt")
+    else:
+        parts = Pack_Window(plan,window,frameBytes=frameBytes,streaming=streaming,frameWait=frameWait)
+        for k,part in enumerate(parts):
+            partFile = root+"_plan_"+str(k+1)+".txt"
+            Write_Script(partFile,part)
+            print ("  ",partFile,"  ",len(part)," steps  ",_hours(Estimate(part,frameBytes,streaming,frameWait)['total']))
@@ -0,0 +1,160 @@
+'''
+    Running exposure ladders on the camera's own sequencer (SequencerControl), instead of
+    setting gain and exposure time from the host before every point.
+
+   Sequencer_Max_Sets   - Number of sequencer sets the camera has
+    Program_Sequencer   - Loads a list of (gain, exposure time) points into the sequencer sets
+        Sequencer_Off   - Switches the sequencer off again
+          Iter_Ladder   - Generator running a whole script ladder through the sequencer
+
+    The sequencer can switch Gain and ExposureTime (and the RoI) from one frame to the next,
+    but not GainConversion, and it has only a few sets (8 on the Blackfly S). A ladder is
+    therefore split into chunks of points with the same GainConversion and number of frames,
+    at most Sequencer_Max_Sets() points each. Each chunk is one streaming acquisition in which
+    the camera steps through the sets on every frame (set 0, 1, ..., N-1, 0, 1, ...), so the
+    frames of the different points come interleaved. Every frame is tagged with its set:
+    taken from the SequencerSetActive chunk if chunk data is on (FLIR_Utils.Enable_Chunks),
+    which stays right even if a frame is dropped, otherwise from the frame ID counted from
+    the first frame of the chunk, which stays right as long as that first frame arrives.
+
+'''
+
+import FLIR_Utils as FU      # All the camera interface stuff
+
+#--------------------------------------------------------------------------------------------
+
+def Sequencer_Max_Sets(cam):
+
+    '''
+        Returns the number of sequencer sets (SequencerSetSelector runs 0..N-1).
+    '''
+
+    setMin,setMax = cam.get_integer_bounds('SequencerSetSelector')
+
+    return setMax - setMin + 1
+
+#--------------------------------------------------------------------------------------------
+
+def Program_Sequencer(cam,points,verbose=False):
+
+    '''
+        Programs one sequencer set per point and switches the sequencer on. Each set
+        moves on to the next at the start of every frame, and the last one back to set 0.
+
+            Input:    cam - the camera
+                      points - list of (gain, expTime) pairs, exposure time in uSec
+                      verbose - how wordy to be
+    '''
+
+    nSets = len(points)
+
+    if nSets > Sequencer_Max_Sets(cam):
+        raise ValueError("Only "+str(Sequencer_Max_Sets(cam))+" sequencer sets, not "+str(nSets))
+
+    cam.set_string('SequencerMode','Off')                 # Must be off to configure
+    cam.set_string('SequencerConfigurationMode','On')
+
+    for feature in ['ExposureTime','Gain']:               # What changes from set to set
+        cam.set_string('SequencerFeatureSelector',feature)
+        cam.set_boolean('SequencerFeatureEnable',True)
+
+    for i,(gain,expTime) in enumerate(points):
+
+        cam.set_integer('SequencerSetSelector',i)
+        cam.set_gain(gain)                                # Gain value
+        cam.set_exposure_time(expTime)                    # Exposure time (uSec)
+
+        cam.set_integer('SequencerPathSelector',0)
+        cam.set_string('SequencerTriggerSource','FrameStart')    # Move on with every frame
+        cam.set_integer('SequencerSetNext',(i+1) % nSets)
+
+        cam.execute_command('SequencerSetSave')
+
+        if verbose:
+            print ("  Sequencer set ",i,": Gain ",gain,"  Exposure Time ",expTime/1.0E6," sec")
+
+    cam.set_integer('SequencerSetStart',0)
+    cam.set_string('SequencerConfigurationMode','Off')
+    cam.set_string('SequencerMode','On')
+
+#--------------------------------------------------------------------------------------------
+
+def Sequencer_Off(cam):
+
+    '''
+        Switches the sequencer off, leaving the camera with the values of the last set used.
+    '''
+
+    cam.set_string('SequencerMode','Off')
+
+#--------------------------------------------------------------------------------------------
+
+def Iter_Ladder(cam,steps,verbose=False,nBuffers=4,telemetry=None):
+
+    '''
+        Runs a whole ladder of script steps through the sequencer.
+
+            Input:    cam - the camera
+                      steps - list of (fName, gainConv, gain, expTime, nFrames), as read from a
+                              CharFLIR script line (exposure time in uSec)
+                      verbose - how wordy to be
+                      nBuffers - buffers in the stream pool
+                      telemetry - (optional) FLIR_Telemetry.AcqTelemetry, passed on to Iter_Frames
+            Yields:   chunk, frames - the list of steps acquired together, and a generator
+                              yielding step, img, meta for each of its frames: the step the
+                              frame belongs to, the frame and its metadata (as
+                              FLIR_Utils.Iter_Frames, with 'sequencerSet', and the step's
+                              'setGain' and 'setExposure'. 'gain' and 'exposure' stay as
+                              the camera reported them in the chunk data, if it did, and
+                              are otherwise the step's)
+
+        The frames of a chunk must be used up before asking for the next chunk:
+
+            for chunk,frames in Iter_Ladder(cam,steps):
+                for step,img,meta in frames:
+                    ...
+    '''
+
+    maxSets = Sequencer_Max_Sets(cam)
+
+    chunks = []        # Consecutive steps with the same GainConversion and nFrames, maxSets at a time
+    for step in steps:
+        if chunks and len(chunks[-1]) < maxSets and chunks[-1][0][1] == step[1] and chunks[-1][0][4] == step[4]:
+            chunks[-1].append(step)
+        else:
+            chunks.append([step])
+
+    def chunkFrames(chunk):
+
+        nSets,nFrames = len(chunk),chunk[0][4]
+        timeout = max(step[3] for step in chunk)/1.0E6 + 2.0     # Longest exposure plus readout margin (sec)
+
+        firstID = None
+
+        for img,meta in FU.Iter_Frames(cam,nFrames*nSets,verbose=verbose,streaming=True,
+                                       nBuffers=nBuffers,timeout=timeout,telemetry=telemetry):
+            if 'sequencerSet' in meta:                # From the frame's chunk data, if enabled
+                k = meta['sequencerSet']
+            else:                                     # Sets are stepped through in turn, one per frame ID,
+                if firstID is None:                   #   so a dropped frame does not shift the ones after it
+                    firstID = meta['frameID']
+                k = (meta['frameID'] - firstID) % nSets
+            step = chunk[k]
+            meta.update({'sequencerSet':k, 'setGain':step[2], 'setExposure':step[3]})
+            fromChunks = meta.get('chunks',[])
+            if 'gain' not in fromChunks:              # Only what the camera did not report
+                meta['gain'] = step[2]
+            if 'exposure' not in fromChunks:
+                meta['exposure'] = step[3]
+            yield step,img,meta
+
+    try:
+        for chunk in chunks:
+
+            cam.set_string('GainConversion',chunk[0][1])     # Gain conversion mode (not sequenced)
+            Program_Sequencer(cam,[(step[2],step[3]) for step in chunk],verbose)
+
+            yield chunk,chunkFrames(chunk)
+
+    finally:
+        Sequencer_Off(cam)
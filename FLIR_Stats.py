@@ -0,0 +1,294 @@
+'''
+    Streaming per-pixel statistics for sequences of FLIR frames.
+
+           FrameStats   - Accumulates running mean and variance maps (Welford), frame by frame
+           Cube_Stats   - Mean and variance of a stored (e.g. memory-mapped) cube, in row tiles
+
+    The accumulator is fed one frame at a time, as the frames come off the camera, so
+    memory use does not grow with the number of frames and the statistics are ready as
+    soon as the last frame has been added. The numbers returned by mean() and variance()
+    are the same as CharFLIR's original np.mean(cube) and np.mean(np.var(cube,axis=0)),
+    or, given a bad-pixel mask (FLIR_BadPix), the same over the good pixels only.
+
+'''
+
+import numpy as np
+
+import FLIR_BadPix as FB     # Bad-pixel masks
+
+#--------------------------------------------------------------------------------------------
+
+class FrameStats:
+
+    '''
+        Running per-pixel statistics using Welford's algorithm. Keeps float64 maps of
+        the running mean and of M2 (sum of squared deviations from the mean), and
+        optionally the per-pixel min/max and the variance of pairwise frame differences
+        (frames 1-2, 3-4, ...), which is insensitive to fixed-pattern structure. The mean
+        of each region of every frame is kept as well, for variance_rse().
+
+            Input:    minMax - whether to keep min/max maps
+                      pairDiff - whether to accumulate pairwise-difference variances
+                      grid - (gy, gx) regions the chip is split into for variance_rse()
+                      mask - (optional) bad pixels (FLIR_BadPix.PixelMask or boolean array),
+                             left out of mean(), variance() and diff_variance(). The maps
+                             still cover all pixels.
+
+        Typical use:
+
+            stats = FrameStats()
+            for frame in frames:
+                stats.add(frame)
+            mean,variance = stats.mean(),stats.variance()
+    '''
+
+    def __init__(self,minMax=False,pairDiff=False,mask=None,grid=(8,8)):
+
+        self.minMax = minMax
+        self.pairDiff = pairDiff
+        self.grid = grid
+        if mask is not None and not isinstance(mask,FB.PixelMask):
+            mask = FB.PixelMask(mask)
+        self.mask = mask
+        self.reset()
+
+    def reset(self):
+
+        '''
+            Forgets everything accumulated so far. The work arrays are kept, so the
+            accumulator can be reused for the next script line without reallocating.
+        '''
+
+        self.n = 0              # Number of frames added so far
+        self.pairVars = []      # Variance of each pair difference (/2), in order
+        self.regionMeans = []   # Mean of each grid region of each frame, in order
+
+    def _allocate(self,shape):
+
+        '''
+            Sets up the float64 work arrays for frames of the given shape.
+        '''
+
+        self.shape = shape
+        self._grid = (min(self.grid[0],shape[0]),min(self.grid[1],shape[1]))
+        self._mean = np.zeros(shape)       # Running mean
+        self._M2 = np.zeros(shape)         # Running sum of squared deviations
+        self._delta = np.empty(shape)      # Scratch arrays, so add() makes no temporaries
+        self._work = np.empty(shape)
+
+        if self.minMax:
+            self._min = np.empty(shape)
+            self._max = np.empty(shape)
+
+        if self.pairDiff:
+            self._prev = np.empty(shape)   # First frame of the current pair
+
+    def add(self,frame):
+
+        '''
+            Adds a single 2D frame (or each frame of a 3D cube) to the statistics.
+        '''
+
+        frame = np.asarray(frame)
+
+        if frame.ndim == 3:         # A cube: add frame by frame
+            for f in frame:
+                self.add(f)
+            return
+
+        if self.n == 0 and getattr(self,'shape',None) != frame.shape:
+            self._allocate(frame.shape)
+
+        self.n += 1
+        self.regionMeans.append(self._grid_mean(frame))
+
+        if self.n == 1:             # First frame: just initialize
+            self._mean[...] = frame
+            self._M2.fill(0.0)
+        else:
+            np.subtract(frame,self._mean,out=self._delta)      # delta = x - mean_old
+            np.divide(self._delta,self.n,out=self._work)
+            self._mean += self._work                           # mean_new = mean_old + delta/n
+            np.subtract(frame,self._mean,out=self._work)
+            self._work *= self._delta
+            self._M2 += self._work                             # M2 += delta*(x - mean_new)
+
+        if self.minMax:
+            if self.n == 1:
+                self._min[...] = frame
+                self._max[...] = frame
+            else:
+                np.minimum(self._min,frame,out=self._min)
+                np.maximum(self._max,frame,out=self._max)
+
+        if self.pairDiff:
+            if self.n % 2 == 1:
+                self._prev[...] = frame                        # Wait for the second frame of the pair
+            else:
+                np.subtract(frame,self._prev,out=self._work)   # Difference image
+                dMean = self._avg(self._work)
+                np.square(self._work,out=self._work)
+                self.pairVars.append((self._avg(self._work) - dMean*dMean)/2.0)
+
+    def _avg(self,arr):
+
+        ''' Mean over the chip, leaving out the masked pixels '''
+
+        return arr.mean() if self.mask is None else self.mask.mean(arr)
+
+    def _grid_mean(self,arr):
+
+        ''' Means of each region of the grid (as PixelMask.grid_mean), as a flat array '''
+
+        if self.mask is not None:
+            return self.mask.grid_mean(arr,self._grid).reshape(-1)
+
+        gy,gx = self._grid
+        ry,rx = arr.shape[0]//gy,arr.shape[1]//gx
+
+        return arr[:gy*ry,:gx*rx].reshape(gy,ry,gx,rx).mean(axis=(1,3),dtype=np.float64).reshape(-1)
+
+    def mean_map(self):
+
+        ''' Per-pixel mean of the frames added so far '''
+
+        return self._mean
+
+    def var_map(self,ddof=0):
+
+        '''
+            Per-pixel variance of the frames added so far. ddof=0 matches np.var().
+        '''
+
+        if self.n - ddof <= 0:
+            return np.zeros(self.shape)
+
+        return self._M2/(self.n - ddof)
+
+    def min_map(self):
+
+        ''' Per-pixel minimum (requires minMax=True) '''
+
+        return self._min
+
+    def max_map(self):
+
+        ''' Per-pixel maximum (requires minMax=True) '''
+
+        return self._max
+
+    def mean(self):
+
+        ''' Average pixel value across the chip and all frames (NaN if there are none) '''
+
+        if self.n == 0:
+            return float('nan')
+
+        return self._avg(self._mean)
+
+    def variance(self):
+
+        '''
+            The average (over the chip) of the per-pixel variance down the frames. NaN
+            if there are no frames, 0.0 for a single frame (as np.var).
+        '''
+
+        if self.n == 0:
+            return float('nan')
+        if self.n < 2:
+            return 0.0
+
+        return self._avg(self._M2)/self.n
+
+    def diff_variance(self):
+
+        '''
+            Average over frame pairs of var(frame_2k - frame_2k-1)/2. Returns None
+            until at least one pair has been added (requires pairDiff=True).
+        '''
+
+        if not self.pairVars:
+            return None
+
+        return float(np.mean(self.pairVars))
+
+    def variance_rse(self):
+
+        '''
+            Relative standard error of variance(), the chip average of the per-pixel
+            variance, as logged. That splits into the variance of the region means down
+            the frames, D (offset drift, illumination changes, anything common to a whole
+            region), and the variance of each pixel about its region's mean, W (independent
+            from pixel to pixel):
+
+                variance() = D + W
+
+            W is averaged over every pixel, so its error is small: W sqrt(2/((n-1) nPix)).
+            D is the average over frames of q_i, the mean squared deviation of the region
+            means of frame i from their averages, so its error is the scatter of the q_i
+            over sqrt(n). With steady offsets the answer is tiny after a few frames; the
+            more of variance() is drift, the more frames it takes. None for fewer than
+            three frames.
+        '''
+
+        n = self.n
+        if n < 3:
+            return None
+
+        total = self.variance()
+        if not total > 0:
+            return None
+
+        means = np.array(self.regionMeans)                       # (n, regions)
+        q = ((means - means.mean(axis=0))**2).mean(axis=1)       # Drift contribution of each frame
+        D = q.mean()
+        W = max(total - D,0.0)
+        nPix = np.prod(self.shape) if self.mask is None else self.mask.nGood
+
+        varW = W*W*2.0/((n-1)*nPix)
+        varD = q.var(ddof=1)/n
+
+        return float(np.sqrt(varW + varD)/total)
+
+#--------------------------------------------------------------------------------------------
+
+def Cube_Stats(cube,nRows=100,mask=None):
+
+    '''
+        Mean and average per-pixel variance of a (nFrames, H, W) cube, computed nRows rows
+        at a time. Intended for memory-mapped cubes (see FLIR_Utils.New_Cube): only one
+        tile of rows is read back and converted to float64 at a time, so memory stays
+        bounded however many frames there are.
+
+            Input:    cube - 3D array (or memmap) of frames
+                      nRows - rows per tile
+                      mask - (optional) bad pixels to leave out (as FrameStats)
+            Returns:  mean, variance - as FrameStats.mean() and FrameStats.variance()
+                      (NaN if the cube has no frames)
+    '''
+
+    nFrames,height,width = cube.shape
+
+    if nFrames == 0:
+        return float('nan'),float('nan')
+
+    if mask is not None and not isinstance(mask,FB.PixelMask):
+        mask = FB.PixelMask(mask)
+
+    total = 0.0       # Sum of all pixel values
+    varSum = 0.0      # Sum of the per-pixel variances
+
+    for r0 in range(0,height,nRows):
+
+        tile = np.asarray(cube[:,r0:r0+nRows,:],dtype=np.float64)   # Read back one tile of rows
+
+        if mask is None:
+            total += tile.sum()
+            varSum += tile.var(axis=0).sum()
+        else:
+            total += mask.sum(tile,r0)
+            varSum += mask.sum(tile.var(axis=0),r0)
+
+    nPix = height*width if mask is None else mask.nGood
+
+    return total/(nFrames*nPix), varSum/nPix
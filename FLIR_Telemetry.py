@@ -0,0 +1,211 @@
+'''
+    Frame-drop and throughput telemetry for GigE acquisitions.
+
+         AcqTelemetry   - Collects per-acquisition statistics and writes them as JSON lines or Prometheus text
+
+    What is recorded:
+
+        frames       - frames delivered, failed (incomplete/timed out) and frames per second
+        stages       - time spent per stage: 'acquire' (waiting for a frame: exposure plus
+                       transfer), 'convert' (buffer to numpy), 'write' (to disk), ...
+        stream       - Aravis stream statistics: completed, failed and underrun buffers, and
+                       resent and missing packets (where this Aravis version provides them)
+        link         - DeviceLinkCurrentThroughput and DeviceLinkThroughputLimit (Bytes/s)
+
+    Used to tune GevSCPSPacketSize, packet delay and bandwidth sharing between cameras.
+
+'''
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+#--------------------------------------------------------------------------------------------
+
+class AcqTelemetry:
+
+    '''
+        Statistics for one acquisition (or, through merge(), for a whole run).
+        Safe to use from several threads (e.g. the CubeWriter threads).
+
+            Input:    name - label for this acquisition (e.g. the output file name)
+                      labels - extra fixed labels (e.g. {'camera': devId}) for the output
+    '''
+
+    def __init__(self,name='',labels=None):
+
+        self.name = name
+        self.labels = dict(labels or {})
+        self.nFrames = 0            # Frames delivered
+        self.nFailed = 0            # Frames lost (incomplete buffer, timeout, no data)
+        self.nBytes = 0             # Pixel data delivered
+        self.stages = {}            # stage -> [count, total seconds]
+        self.stream = {}            # Aravis stream statistics
+        self.link = {}              # Link throughput values
+        self.tStart = None          # Host time of first and last frame
+        self.tEnd = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+
+        ''' Clears everything, to start on the next acquisition '''
+
+        with self._lock:
+            self.nFrames = self.nFailed = self.nBytes = 0
+            self.stages = {}
+            self.stream = {}
+            self.link = {}
+            self.tStart = self.tEnd = None
+
+    @contextmanager
+    def stage(self,name):
+
+        '''
+            Times the enclosed block and adds it to stage name:
+
+                with tel.stage('convert'):
+                    ...
+        '''
+
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name,time.perf_counter()-t0)
+
+    def add_time(self,name,seconds):
+
+        ''' Adds seconds to stage name '''
+
+        with self._lock:
+            entry = self.stages.setdefault(name,[0,0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def frame(self,nBytes=0,ok=True):
+
+        ''' Counts a delivered (ok=True) or lost frame '''
+
+        now = time.perf_counter()
+
+        with self._lock:
+            if ok:
+                self.nFrames += 1
+                self.nBytes += nBytes
+                if self.tStart is None:
+                    self.tStart = now
+                self.tEnd = now
+            else:
+                self.nFailed += 1
+
+    def read_stream(self,stream):
+
+        '''
+            Reads the Aravis stream statistics. Packet counters are only available from
+            Aravis versions that have get_info_uint64_by_name.
+        '''
+
+        completed,failures,underruns = stream.get_statistics()
+        self.stream.update({'completed':completed, 'failed':failures, 'underruns':underruns})
+
+        for key in ['n_resent_packets','n_missing_packets']:
+            try:
+                self.stream[key[2:]] = stream.get_info_uint64_by_name(key)
+            except Exception:     # Not in this Aravis version
+                pass
+
+    def read_link(self,cam):
+
+        ''' Reads the current link throughput and its limit (Bytes/s) '''
+
+        for key,feature in [('currentThroughput','DeviceLinkCurrentThroughput'),
+                            ('throughputLimit','DeviceLinkThroughputLimit')]:
+            try:
+                self.link[key] = cam.get_integer(feature)
+            except Exception:     # e.g. the fake camera
+                pass
+
+    def fps(self):
+
+        ''' Frames per second between the first and the last frame '''
+
+        if self.nFrames < 2 or self.tStart is None or self.tEnd is None or self.tEnd <= self.tStart:
+            return 0.0
+
+        return (self.nFrames-1)/(self.tEnd-self.tStart)
+
+    def merge(self,other):
+
+        '''
+            Adds the counts and stage times of another AcqTelemetry (e.g. one script line)
+            into this one (e.g. the whole run), and widens the first-to-last frame times to
+            cover both. Stream counters are added up (each acquisition opens its own stream);
+            link values are taken from the latest.
+        '''
+
+        with self._lock:
+            self.nFrames += other.nFrames
+            self.nFailed += other.nFailed
+            self.nBytes += other.nBytes
+            if other.tStart is not None:
+                self.tStart = other.tStart if self.tStart is None else min(self.tStart,other.tStart)
+            if other.tEnd is not None:
+                self.tEnd = other.tEnd if self.tEnd is None else max(self.tEnd,other.tEnd)
+            for name,(count,total) in other.stages.items():
+                entry = self.stages.setdefault(name,[0,0.0])
+                entry[0] += count
+                entry[1] += total
+            for key,value in other.stream.items():
+                self.stream[key] = self.stream.get(key,0) + value
+            self.link.update(other.link)
+
+    def record(self):
+
+        ''' Everything as a dict (the JSON record) '''
+
+        with self._lock:
+            return {'name':self.name, 'labels':self.labels, 'time':time.time(),
+                    'frames':self.nFrames, 'failed':self.nFailed, 'bytes':self.nBytes,
+                    'fps':self.fps(),
+                    'stages':{name:{'count':count, 'seconds':total, 'perFrame':total/count}
+                              for name,(count,total) in self.stages.items()},
+                    'stream':dict(self.stream), 'link':dict(self.link)}
+
+    def write_json(self,fName):
+
+        ''' Appends the record as one line of JSON to fName '''
+
+        with open(fName,"a") as f:
+            f.write(json.dumps(self.record())+"\n")
+
+    def write_prometheus(self,fName,prefix='flir'):
+
+        '''
+            Writes the record in Prometheus text format (e.g. for the node exporter's
+            textfile collector). The file is replaced atomically.
+        '''
+
+        rec = self.record()
+        labels = ",".join('%s="%s"' % (k,v) for k,v in sorted(rec['labels'].items()))
+
+        def metric(name,value,extra=''):
+            lab = ",".join(s for s in [labels,extra] if s)
+            return "%s_%s{%s} %s\n" % (prefix,name,lab,value)
+
+        lines = [metric('frames_total',rec['frames']), metric('frames_failed_total',rec['failed']),
+                 metric('bytes_total',rec['bytes']), metric('frames_per_second',rec['fps'])]
+
+        for name,s in sorted(rec['stages'].items()):
+            lines.append(metric('stage_seconds_total',s['seconds'],'stage="%s"' % name))
+            lines.append(metric('stage_seconds_per_frame',s['perFrame'],'stage="%s"' % name))
+        for key,value in sorted(rec['stream'].items()):
+            lines.append(metric('stream_'+key,value))
+        for key,value in sorted(rec['link'].items()):
+            lines.append(metric('link_'+key,value))
+
+        tmpName = fName+".tmp"
+        with open(tmpName,"w") as f:
+            f.writelines(lines)
+        os.replace(tmpName,fName)
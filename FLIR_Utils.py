@@ -2,27 +2,44 @@
     Python utilities to work with the FLIR camera.
 
          Setup_Camera   - Does initial setup, returning cam, dev
-    Standard_Settings   - Sets up and (eventually) checks standard settings that are unlikely to change.
+         Tune_Network   - Sets the largest working packet size and a fair share of the link bandwidth
+    Standard_Settings   - Sets up and checks standard settings that are unlikely to change.
+       Apply_Settings   - Writes only the settings of a profile that differ, then verifies them
+         Save_UserSet   - Saves the current settings to a camera UserSet (power-up default)
+         Set_Geometry   - Sets RoI, binning and decimation, writing only what changes
+           Guide_Mode   - Switches to the bounding box of one or more guide RoIs (optionally binned)
+           Full_Frame   - Switches back to the standard full frame
+             Cut_ROIs   - Cuts the guide RoIs out of a (bounding box) frame or cube
            FLIR2numpy   - Converts a (single frame) FLIR buffer to numpy
+             New_Cube   - Allocates an empty frame cube matching the camera RoI
+        Enable_Chunks   - Turns on per-frame chunk data (FrameID, timestamp, exposure, gain, CRC)
+           Chunk_Meta   - Reads the chunk data of a frame into its metadata
+           Meta_Array   - Packs per-frame metadata into a compact record array
+  Find_Dropped_Frames   - Lists frame IDs missing from a sequence
           FLIR_Status   - Prints a lot of camera status info
            FLIR_Power   - Returns voltage, current, power, temperature
             Write_PNG   - Writes a PNG file with the supplied image
+          Open_Stream   - Creates a stream with a pool of preallocated buffers
+          Iter_Frames   - Generator yielding frames (and metadata) as they arrive
        Acquire_Frames   - Acquires and returns a single frame or multiple frames
             ResetFLIR   - Immediately resets and reboots the device
      FactoryResetFLIR   - Does a reset to Factory parameter values
 '''
 
-import sys
 import gi           # To ensure correct Aravis version
 import cv2          # To (optionally) write png files
 import numpy as np
 
+import FLIR_Features as FF    # Cached access to camera features
+import FLIR_Telemetry as FT   # Frame-drop and throughput statistics
+import FLIR_Pack as FP        # 12-bit unpacking
+
 gi.require_version('Aravis', '0.8')     # Version check
 from gi.repository import Aravis        # Aravis package
 
 #--------------------------------------------------------------------------------------------
 
-def Setup_Camera(verbose, fakeCam = False):
+def Setup_Camera(verbose, fakeCam = False, devIndex = 0, tuneNetwork = False, nCameras = 1):
 
     '''
         Instantiates a camera and returns it, along with the corresponding "dev". This
@@ -31,6 +48,12 @@ def Setup_Camera(verbose, fakeCam = False):
         If fakeCam = True, it returns the fake camera object, a software equivalent,
         with (presumably realistic) noise, etc.
 
+        devIndex selects which of the cameras found on the network to open (0 to
+        Aravis.get_n_devices()-1). To run several cameras at once, see FLIR_Multi.
+
+        If tuneNetwork = True, the GigE packet size and bandwidth are set up with
+        Tune_Network, for nCameras cameras sharing the host's network interface.
+
     '''
 
     Aravis.update_device_list()             # Scan for live cameras
@@ -42,61 +65,207 @@ def Setup_Camera(verbose, fakeCam = False):
         if verbose:
             print ("Instantiated FakeCam")
 
-    else:             # Note: We expect only one "real" camera !!
+    else:             # Note: Only camera number devIndex is opened
 
         try:
-            cam = Aravis.Camera.new(Aravis.get_device_id(0))      # Instantiate cam
+            cam = Aravis.Camera.new(Aravis.get_device_id(devIndex))      # Instantiate cam
             if verbose: 
                    print ("Instantiated real camera")
         except:
           print("ERROR - No camera found")  # Ooops!!
-          return None,None,None             # Send back nothing
+          return None,None                  # Send back nothing
 
     dev = cam.get_device()        # Allows access to "deeper" features
 
+    if tuneNetwork and not fakeCam:
+        Tune_Network(cam,dev,nCameras,verbose)
+
     return cam,dev          # Send back camera, device
 
 #--------------------------------------------------------------------------------------------
 
-def Standard_Settings(cam, dev, verbose):
+def Tune_Network(cam,dev,nCameras=1,verbose=False,reserve=0.1):
 
     '''
-        Write standard settings to the camera. This is typically items that will
-        never change (such as single frame mode, use full frame, no Auto-exposure, etc.)
+        Sets up the GigE streaming channel of a camera:
+
+          - GevSCPSPacketSize: the largest packet size that gets through to the host,
+            found by Aravis firing test packets (GevSCPSFireTestPacket) of decreasing
+            size. Jumbo frames (MTU 9000) need far fewer packets per frame than 1500.
+          - DeviceLinkThroughputLimit: the link speed, less a reserve for resends and
+            control traffic, divided between nCameras sharing one network interface.
+            The camera spaces its packets (GevSCPD) to stay under this limit. Cameras
+            without the feature get the equivalent packet delay set directly.
+
+            Input:    cam, dev - as returned by Setup_Camera
+                      nCameras - cameras sharing the host's network interface
+                      verbose - how wordy to be
+                      reserve - fraction of the link speed kept free
+            Returns:  dict with packetSize, packetDelay (nsec), linkSpeed, throughputLimit
+                      and currentThroughput (Bytes/s), and maxFrameRate (Hz) at the
+                      current payload. None if the camera is not a GigE camera.
+    '''
 
-        Note that the DefectCorrectStaticEnable option uses an internal look-up table of
-        factory-measured bad pixels and interpolates across them. We want this off!
+    if not cam.is_gv_device():
+        print("ERROR - Not a GigE Vision camera, network not tuned")
+        return None
+
+    packetSize = cam.gv_auto_packet_size()      # Largest test packet that arrives
+
+    linkSpeed = cam.get_integer('DeviceLinkSpeed')             # Bytes/s
+    share = int(linkSpeed*(1.0-reserve)/nCameras)
+
+    if cam.is_feature_available('DeviceLinkThroughputLimit'):
+        limitMin,limitMax = cam.get_integer_bounds('DeviceLinkThroughputLimit')
+        share = min(max(share,limitMin),limitMax)
+        cam.set_integer('DeviceLinkThroughputLimit',share)      # Sets GevSCPD to match
+    else:
+        packetTime = 1.0E9*packetSize/linkSpeed                 # nsec on the wire per packet
+        cam.gv_set_packet_delay(int(packetTime*(linkSpeed/share - 1.0)))
+
+    net = {'packetSize'        : cam.gv_get_packet_size(),
+           'packetDelay'       : cam.gv_get_packet_delay(),
+           'linkSpeed'         : linkSpeed,
+           'throughputLimit'   : share,
+           'currentThroughput' : cam.get_integer('DeviceLinkCurrentThroughput'),
+           'maxFrameRate'      : share/cam.get_payload()}
+
+    if verbose:
+        print ("  Packet size ",net['packetSize']," Bytes,  packet delay ",net['packetDelay']," nsec")
+        print ("  Link speed ",linkSpeed/1.0E6," MB/s,  limit ",share/1.0E6," MB/s (",nCameras," camera(s))")
+        print ("  Current throughput ",net['currentThroughput']/1.0E6," MB/s,  max ",
+               "{:.2f}".format(net['maxFrameRate'])," frames/s")
+
+    return net
+
+#--------------------------------------------------------------------------------------------
+
+# The standard settings, in the order they are applied: (feature, type, value).
+# Offsets go to 0 before Width/Height are set, so the full frame always fits.
+
+STANDARD_PROFILE = [
+    ('BinningHorizontal',          'int',    1),              # Pixel binning 1x1
+    ('BinningVertical',            'int',    1),
+    ('DecimationHorizontal',       'int',    1),              # No decimation
+    ('DecimationVertical',         'int',    1),
+    ('OffsetX',                    'int',    0),              # Use full frame
+    ('OffsetY',                    'int',    0),
+    ('Width',                      'int',    1600),
+    ('Height',                     'int',    1100),
+    ('TriggerSelector',            'string', 'FrameStart'),   # Free running (as cam.set_frame_rate does)
+    ('TriggerMode',                'string', 'Off'),
+    ('AcquisitionFrameRateEnable', 'bool',   True),
+    ('AcquisitionFrameRate',       'float',  1.0),            # Frame rate (Hz). I don't think that this has any effect (for single frames)
+    ('PixelFormat',                'string', 'Mono16'),
+    ('GammaEnable',                'bool',   False),          # No gamma correction!
+    ('ExposureAuto',               'string', 'Off'),          # Auto-exposure off
+    ('GainAuto',                   'string', 'Off'),          # Also auto-gain
+    ('AcquisitionMode',            'string', 'SingleFrame'),  # Set to single frames
+    ('ReverseX',                   'bool',   False),          # Use these to flip left-right
+    ('ReverseY',                   'bool',   False),          #   and up-down
+    ('AdcBitDepth',                'string', 'Bit12'),        # 12-bit ADC - only option for this camera
+    ('DeviceTemperatureSelector',  'string', 'Sensor'),       # Which temperature sensor - only option for this camera
+    ('DefectCorrectStaticEnable',  'bool',   False),          # Turn off auto-correction of (known) bad pixels
+    ('BlackLevelClampingEnable',   'bool',   False),          # CHECK - seems to correct low signal clamping
+]
+
+#--------------------------------------------------------------------------------------------
+
+def Apply_Settings(cam,profile,verbose=False):
+
+    '''
+        Brings the camera to the settings in profile, a list of (feature, type, value)
+        with type one of 'int', 'float', 'bool' or 'string' (see STANDARD_PROFILE).
+        Each feature is read first and only written if it differs; the written features
+        are then read back to check that they took.
 
+            Returns:  changed - the features that had to be written
+                      failed - the features that still differ after writing
     '''
 
-    # [fWid,fHgt] = cam.get_sensor_size()   # Full frame size
+    getters = {'int':cam.get_integer, 'float':cam.get_float, 'bool':cam.get_boolean, 'string':cam.get_string}
+    setters = {'int':cam.set_integer, 'float':cam.set_float, 'bool':cam.set_boolean, 'string':cam.set_string}
 
-    fWid,fHgt = 1600,1100                 # Full frame size
-    cam.set_binning(1,1)                  # Pixel binning 1x1
-    cam.set_region(0,0,fWid,fHgt)         # Use full frame
+    def same(ftype,current,value):
+        if ftype == 'float':
+            return abs(current-value) <= 1.0E-6*max(abs(value),1.0)
+        return current == value
 
-    frameRate = 1.0                       # Frame rate (Hz). I don't think that this has any effect (for single frames)
-    cam.set_frame_rate(frameRate)         # Frame rate (Hz)
+    changed = []
+    for feature,ftype,value in profile:
+        if not same(ftype,getters[ftype](feature),value):
+            setters[ftype](feature,value)
+            changed.append(feature)
 
-    dev.set_string_feature_value('PixelFormat', 'Mono16')
+    failed = []
+    for feature,ftype,value in profile:
+        if feature in changed and not same(ftype,getters[ftype](feature),value):
+            failed.append(feature)
+            print ("ERROR - ",feature," did not take the value ",value)
 
-    cam.set_boolean('GammaEnable',False)                                               # No gamma correction!
-    cam.set_exposure_time_auto(Aravis.auto_from_string('Off'))                         # Auto-exposure off
-    cam.set_gain_auto(Aravis.auto_from_string('Off'))                                  # Also auto-gain
-    cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('SingleFrame')) )   # Set to single frames
+    if verbose:
+        if changed:
+            print ("Changed settings : ",", ".join(changed))
+        else:
+            print ("All settings already as required")
 
-    cam.set_boolean('ReverseX',False)     # Use these to flip left-right
-    cam.set_boolean('ReverseY',False)     #   and up-down
+    return changed,failed
 
-    cam.set_string('AdcBitDepth','Bit12')                  # 12-bit ADC - only option for this camera
-    cam.set_string('DeviceTemperatureSelector','Sensor')   # Which temperature sensor - only option for this camera
+#--------------------------------------------------------------------------------------------
 
-    cam.set_boolean('DefectCorrectStaticEnable',False)     # Turn off auto-correction of (known) bad pixels
+def Save_UserSet(cam,userSet='UserSet1',makeDefault=True,verbose=False):
 
-    cam.set_boolean('BlackLevelClampingEnable',False)      # CHECK - seems to correct low signal clamping
+    '''
+        Saves the current settings into one of the camera's user sets (UserSet0 or
+        UserSet1) and, if makeDefault is True, makes it the set loaded at power-up or
+        after a reset. The camera then comes back already configured.
+    '''
+
+    cam.set_string('UserSetSelector',userSet)
+    cam.execute_command('UserSetSave')
+
+    if makeDefault:
+        cam.set_string('UserSetDefault',userSet)
 
     if verbose:
-        print ("Set RoI to Full Frame ",fWid," x ",fHgt)
+        print ("Saved settings to ",userSet,", default at power-up" if makeDefault else "")
+
+#--------------------------------------------------------------------------------------------
+
+def Standard_Settings(cam, dev, verbose, saveUserSet=None, pixelFormat=None):
+
+    '''
+        Write standard settings to the camera. This is typically items that will
+        never change (such as single frame mode, use full frame, no Auto-exposure, etc.)
+
+        Note that the DefectCorrectStaticEnable option uses an internal look-up table of
+        factory-measured bad pixels and interpolates across them. We want this off!
+
+        The settings are those in STANDARD_PROFILE. Only those that differ from what the
+        camera already has are written (see Apply_Settings), so calling this on a camera
+        that is already set up costs just the reads. If saveUserSet is given (e.g.
+        'UserSet1'), the result is also saved there as the power-up default.
+
+        pixelFormat overrides the standard Mono16: 'Mono12p' or 'Mono12Packed' send the
+        same 12-bit pixel values in 25% fewer bytes (FLIR2numpy unpacks them).
+
+        Returns the list of features that had to be changed.
+
+    '''
+
+    profile = STANDARD_PROFILE
+    if pixelFormat is not None:
+        profile = [(f,t,pixelFormat if f=='PixelFormat' else v) for f,t,v in profile]
+
+    changed,failed = Apply_Settings(cam,profile,verbose)
+
+    if saveUserSet is not None and not failed:
+        Save_UserSet(cam,saveUserSet,True,verbose)
+
+    if verbose:
+        values = {feature:value for feature,ftype,value in profile}
+        print ("Set RoI to Full Frame ",values['Width']," x ",values['Height'])
+        print ("Pixel format ",values['PixelFormat'])
         print ("Set binning to 1 x 1")
         print ("Auto-exposure off, Single frame mode")
         print ("No X or Y-flips of frame")
@@ -108,48 +277,187 @@ def Standard_Settings(cam, dev, verbose):
     # [x,y,width,height] = cam.get_region()             # Get RoI details
     # print(cam.dup_available_enumerations_as_display_names('GainConversion'))  # List Gain Conversion modes
 
+    return changed
+
 #--------------------------------------------------------------------------------------------
 
-def FLIR2numpy(buf,verbose):
+def Set_Geometry(cam,x=0,y=0,width=None,height=None,binning=1,decimation=1,verbose=False):
+
+    '''
+        Sets the RoI, binning and decimation. The RoI is given in (unbinned) sensor pixels
+        and widened as needed to the camera's offset and size increments. As with
+        Apply_Settings, only features that differ are written, and the offsets and sizes
+        are written in an order that is valid from any current RoI.
+
+            Input:    cam - the camera
+                      x, y, width, height - RoI in sensor pixels (width/height None = to the edge)
+                      binning - pixels summed (averaged) in each direction (1, 2, 4)
+                      decimation - only every decimation-th pixel is read (1, 2, 4)
+                      verbose - how wordy to be
+            Returns:  changed - the features that had to be written
+                      region - the resulting x, y, width, height, in binned/decimated pixels
+
+        The RoI (and payload) values of a FLIR_Features.FeatureCache must be invalidated
+        afterwards.
+    '''
+
+    sensorWid,sensorHgt = cam.get_sensor_size()
+    f = binning*decimation                        # Sensor pixels per output pixel
+    maxWid,maxHgt = sensorWid//f,sensorHgt//f
+
+    if width is None:
+        width = sensorWid - x
+    if height is None:
+        height = sensorHgt - y
+
+    def fit(start,size,maxSize,offInc,sizeInc):
+        lo,hi = start//f//offInc*offInc,-(-(start+size)//f)      # Binned pixels covering the RoI
+        size = min(-(-(hi-lo)//sizeInc)*sizeInc,maxSize - maxSize % sizeInc)
+        lo = min(lo,(maxSize-size)//offInc*offInc)                # Keep it on the sensor
+        return lo,size
+
+    newX,newWid = fit(x,width,maxWid,cam.get_x_offset_increment(),cam.get_width_increment())
+    newY,newHgt = fit(y,height,maxHgt,cam.get_y_offset_increment(),cam.get_height_increment())
+
+    changed,failed = Apply_Settings(cam,[('BinningHorizontal',    'int', binning),     # First: changes the RoI limits
+                                         ('BinningVertical',      'int', binning),
+                                         ('DecimationHorizontal', 'int', decimation),
+                                         ('DecimationVertical',   'int', decimation)],verbose)
+
+    curX,curY,curWid,curHgt = cam.get_region()
+    profile = []
+    if newWid <= curWid:                              # Shrink first, then move - or move first, then grow
+        profile += [('Width','int',newWid), ('OffsetX','int',newX)]
+    else:
+        profile += [('OffsetX','int',newX), ('Width','int',newWid)]
+    if newHgt <= curHgt:
+        profile += [('Height','int',newHgt), ('OffsetY','int',newY)]
+    else:
+        profile += [('OffsetY','int',newY), ('Height','int',newHgt)]
+
+    changedRoI,failedRoI = Apply_Settings(cam,profile,verbose)
+
+    region = tuple(cam.get_region())
+
+    if verbose:
+        print ("RoI ",region[2]," x ",region[3]," at ",region[0],",",region[1],
+               "  binning ",binning,"  decimation ",decimation)
+
+    return changed+changedRoI,region
+
+#--------------------------------------------------------------------------------------------
+
+def Guide_Mode(cam,rois,binning=1,decimation=1,frameRate=None,verbose=False):
+
+    '''
+        Fast guiding: reads out only the bounding box of the guide star RoIs, optionally
+        binned or decimated. Transfer and conversion time go down with the pixel count.
+
+            Input:    cam - the camera
+                      rois - list of (x, y, width, height) boxes in sensor pixels
+                      binning, decimation - as Set_Geometry
+                      frameRate - frame rate limit (Hz), or None to run as fast as the
+                                  exposure time and readout allow
+                      verbose - how wordy to be
+            Returns:  boxes - for each RoI, its (y0, y1, x0, x1) within the frames, for Cut_ROIs
+
+        Several boxes far apart give a large bounding box; the Blackfly S has only one
+        RoI, so the boxes are cut out on the host.
+    '''
+
+    x0 = min(r[0] for r in rois)
+    y0 = min(r[1] for r in rois)
+    x1 = max(r[0]+r[2] for r in rois)
+    y1 = max(r[1]+r[3] for r in rois)
+
+    changed,region = Set_Geometry(cam,x0,y0,x1-x0,y1-y0,binning,decimation,verbose)
+
+    if frameRate is None:
+        Apply_Settings(cam,[('AcquisitionFrameRateEnable','bool',False)],verbose)
+    else:
+        Apply_Settings(cam,[('AcquisitionFrameRateEnable','bool',True),
+                            ('AcquisitionFrameRate','float',frameRate)],verbose)
+
+    f = binning*decimation
+    boxes = [(r[1]//f-region[1], -(-(r[1]+r[3])//f)-region[1],
+              r[0]//f-region[0], -(-(r[0]+r[2])//f)-region[0]) for r in rois]
+
+    return boxes
+
+#--------------------------------------------------------------------------------------------
+
+def Full_Frame(cam,verbose=False):
+
+    '''
+        Back from Guide_Mode to the full frame, unbinned, with the standard frame rate
+        settings (STANDARD_PROFILE). Returns the list of features that had to be changed.
+    '''
+
+    changed,region = Set_Geometry(cam,verbose=verbose)
+
+    rate = [s for s in STANDARD_PROFILE if s[0] in ('AcquisitionFrameRateEnable','AcquisitionFrameRate')]
+    changedRate,failed = Apply_Settings(cam,rate,verbose)
+
+    return changed+changedRate
+
+#--------------------------------------------------------------------------------------------
+
+def Cut_ROIs(img,boxes):
+
+    '''
+        Returns the guide RoIs (views, not copies) cut out of a frame, or out of every
+        frame of a cube, using the boxes returned by Guide_Mode.
+    '''
+
+    return [img[...,y0:y1,x0:x1] for y0,y1,x0,x1 in boxes]
+
+#--------------------------------------------------------------------------------------------
+
+# Packed 12-bit pixel formats (GenICam PFNC codes) and their unpackers
+
+PACKED_FORMATS = {
+    0x010C0047 : FP.Unpack_Mono12p,           # Mono12p
+    0x010C0006 : FP.Unpack_Mono12Packed,      # Mono12Packed
+}
+
+def FLIR2numpy(buf,verbose,out=None):
 
     '''
         Converts FLIR camera buffer to numpy Array
 
             Input:    buf - a (single frame) buffer returned from the FLIR camera
                       verbose - how wordy to be
-            Returns:  img - a numpy array of the frame
-    '''
+                      out - (optional) 2D array, e.g. one slice of a cube, to write into
+            Returns:  img - a numpy array of the frame (out, if given)
+
+        buf.get_data() hands over a bytes copy of the buffer's data, which is read with
+        np.frombuffer (no ctypes). With out, the pixels are copied straight from it into out;
+        without, they are copied into a new (writable) array.
 
-    import ctypes     # Allows access to C data types (to read FLIR buffer)
+        Packed 12-bit formats (Mono12p, Mono12Packed; see PACKED_FORMATS) are unpacked to
+        uint16, straight into out if given, and come out identical to Mono16.
+    '''
 
     if not buf:       # Nothing there. Return nothing
         return None
 
-    pixel_format = buf.get_image_pixel_format()
-    print("pixel_format ",pixel_format)
-
-    bits_per_pixel = pixel_format >> 16 & 0xff
+    pixfmt = buf.get_image_pixel_format()
+    bits_per_pixel = pixfmt >> 16 & 0xff
+    height,width = buf.get_image_height(),buf.get_image_width()
 
-    print("bpp=",bits_per_pixel)
+    if bits_per_pixel == 12 and pixfmt in PACKED_FORMATS:      # 3 bytes per 2 pixels
+        im = PACKED_FORMATS[pixfmt](buf.get_data(),(height,width),out)
 
-    if bits_per_pixel == 8:
-        INTP = ctypes.POINTER(ctypes.c_uint8)
     else:
-        INTP = ctypes.POINTER(ctypes.c_uint16)
-
-    addr = buf.get_data()
-    ptr = ctypes.cast(addr, INTP)
-    im = np.ctypeslib.as_array(ptr, (buf.get_image_height(), buf.get_image_width()))
-    im = im.copy()
+        dtype = np.uint8 if bits_per_pixel == 8 else np.uint16
 
-    print ("im size ",sys.getsizeof(im))
-    print ("im type ",im.dtype)
-    # f = open('im.bin', 'w+b')
-    # binary_format = bytearray(im)
-    # f.write(binary_format)
-    # f.close()
+        im = np.frombuffer(buf.get_data(),dtype=dtype,count=height*width).reshape(height,width)
 
-    np.save("im",im)    # Make a .npy file    
+        if out is not None:
+            out[...] = im     # Straight into the caller's array
+            im = out
+        else:
+            im = im.copy()    # frombuffer on bytes is read-only
 
     if verbose:
         print ("Mean, standard dev  ",np.mean(im), np.std(im))
@@ -158,55 +466,190 @@ def FLIR2numpy(buf,verbose):
 
 #--------------------------------------------------------------------------------------------
 
-def FLIR_Status(cam,dev):
+def New_Cube(cam,nFrames,fName=None):
+
+    '''
+        Allocates an empty (nFrames, H, W) cube matching the camera's current RoI and
+        pixel format, for Acquire_Frames to convert frames into.
+
+        If fName is given, the cube is instead a memory-mapped .npy file of that name
+        (np.lib.format.open_memmap), sized up front. Each frame converted into it goes
+        to disk without the whole cube ever having to be held in RAM.
+    '''
+
+    [x,y,width,height] = cam.get_region()                 # Get RoI details
+    bits_per_pixel = cam.get_pixel_format() >> 16 & 0xff
+
+    dtype = np.uint8 if bits_per_pixel == 8 else np.uint16
+
+    if fName is not None:
+        return np.lib.format.open_memmap(fName,mode='w+',dtype=dtype,shape=(nFrames,height,width))
+
+    return np.empty((nFrames,height,width),dtype=dtype)
+
+# Chunk data appended by the camera to every frame: (meta key, chunk feature, type)
+
+CHUNK_FIELDS = [
+    ('frameID',      'ChunkFrameID',            'int'),
+    ('timestamp',    'ChunkTimestamp',          'int'),
+    ('exposure',     'ChunkExposureTime',       'float'),
+    ('gain',         'ChunkGain',               'float'),
+    ('crc',          'ChunkCRC',                'int'),
+    ('sequencerSet', 'ChunkSequencerSetActive', 'int'),
+]
+
+CHUNKS = ['FrameID','Timestamp','ExposureTime','Gain','CRC']     # Enabled by default
+
+# Compact per-frame record, as stored next to the pixel data (see Meta_Array)
+
+FRAME_META_DTYPE = np.dtype([('frameID','u8'), ('timestamp','u8'), ('exposure','f8'),
+                             ('gain','f8'), ('crc','u8'), ('sequencerSet','i2')])
+
+#--------------------------------------------------------------------------------------------
+
+def Enable_Chunks(cam,chunks=CHUNKS,verbose=False):
+
+    '''
+        Turns on chunk mode (ChunkModeActive) and the given chunks (ChunkSelector /
+        ChunkEnable), so that every frame carries its own FrameID, timestamp, exposure
+        time, gain and CRC. Iter_Frames then takes the metadata from the frame itself,
+        with no extra camera reads.
+    '''
+
+    cam.set_boolean('ChunkModeActive',True)
+
+    for chunk in ['Image']+list(chunks):     # The image itself is a chunk too
+        cam.set_string('ChunkSelector',chunk)
+        cam.set_boolean('ChunkEnable',True)
+
+    if verbose:
+        print ("Chunk data on: ",", ".join(chunks))
+
+#--------------------------------------------------------------------------------------------
+
+def Chunk_Meta(parser,buf,meta):
+
+    '''
+        Updates the metadata dict meta with the chunk values found in buf (see
+        CHUNK_FIELDS), using an Aravis.ChunkParser from cam.create_chunk_parser().
+        Chunks that are not enabled are skipped. meta['chunks'] lists the keys that came
+        from the chunk data.
+    '''
+
+    found = []
+    for key,feature,ftype in CHUNK_FIELDS:
+        try:
+            if ftype == 'int':
+                meta[key] = parser.get_integer_value(buf,feature)
+            else:
+                meta[key] = parser.get_float_value(buf,feature)
+            found.append(key)
+        except Exception:       # Chunk not enabled
+            pass
+
+    meta['chunks'] = found
+
+    return meta
+
+#--------------------------------------------------------------------------------------------
+
+def Meta_Array(metaList):
+
+    '''
+        Packs a list of per-frame metadata dicts (from Iter_Frames) into a compact
+        numpy record array of FRAME_META_DTYPE. Missing values are left as 0 (-1 for
+        sequencerSet).
+    '''
+
+    metaArr = np.zeros(len(metaList),dtype=FRAME_META_DTYPE)
+    metaArr['sequencerSet'] = -1
+
+    for k,meta in enumerate(metaList):
+        for key in FRAME_META_DTYPE.names:
+            if key in meta:
+                metaArr[k][key] = meta[key]
+
+    return metaArr
+
+#--------------------------------------------------------------------------------------------
+
+def Find_Dropped_Frames(metaArr):
+
+    '''
+        Returns the frame IDs missing from a sequence of frames (gaps in frameID).
+    '''
+
+    ids = np.asarray(metaArr['frameID'] if metaArr.dtype.names else metaArr,dtype=np.int64)
+    missing = []
+
+    for k in np.nonzero(np.diff(ids) > 1)[0]:
+        missing.extend(range(ids[k]+1,ids[k+1]))
+
+    return missing
+
+#--------------------------------------------------------------------------------------------
+
+def FLIR_Status(cam,dev,cache=None):
 
     '''
         Prints a whole lot of info from the camera. Verbose is the only way...
+
+        The values come from a FLIR_Features.FeatureCache (a new one, if none is given),
+        so each feature is read from the camera at most once.
     '''
 
-    [fullWidth,fullHeight] = cam.get_sensor_size()    # Full frame size
-    [x,y,width,height] = cam.get_region()             # Get RoI details
-    payload = cam.get_payload()                       # Get "payload", the size of in bytes
+    if cache is None:
+        cache = FF.FeatureCache(cam,dev)
+
+    s = cache.snapshot(('static','settings'))
 
+    [fullWidth,fullHeight] = s['sensorSize']      # Full frame size
+    [x,y,width,height] = s['region']              # Get RoI details
+    payload = s['payload']                        # Get "payload", the size of in bytes
 
-    print("Camera vendor : %s" %(cam.get_vendor_name()))
-    print("Camera model  : %s" %(cam.get_model_name()))
-    print("Camera id     : %s" %(cam.get_device_id()))
-    print("Pixel format  : %s" %(cam.get_pixel_format_as_string()))
+
+    print("Camera vendor : %s" %(s['vendor']))
+    print("Camera model  : %s" %(s['model']))
+    print("Camera id     : %s" %(s['deviceId']))
+    print("Pixel format  : %s" %(s['pixelFormat']))
 
     print ("")
     print("Full Frame is : %dx%d "%(fullWidth,fullHeight))
     print("ROI           : %dx%d at %d,%d" %(width, height, x, y))
-    print("Pixel format  : %s" %(cam.get_pixel_format_as_string()))
+    print("Pixel format  : %s" %(s['pixelFormat']))
     print("Frame size     : %d  Bytes" %(payload))
 
     print ("")
-    print("Framerate     : %s Hz" %(cam.get_frame_rate()))
-    print("Exposure time : %s seconds " %(cam.get_exposure_time()/1.0E6))
-    print("Gain Conv.    : ",cam.get_string('GainConversion'))
-    print("Gamma enable  : ",cam.get_boolean('GammaEnable'))
-    print("Gamma value   : ",cam.get_float('Gamma'))
+    print("Framerate     : %s Hz" %(s['frameRate']))
+    print("Exposure time : %s seconds " %(s['expTime']))
+    print("Gain Conv.    : ",s['gainConv'])
+    print("Gamma enable  : ",s['gammaEnable'])
+    print("Gamma value   : ",s['gamma'])
 
     print("")
-    print ("Available Formats : ",cam.dup_available_pixel_formats_as_display_names ())
-    print ("acquisition_mode ",Aravis.acquisition_mode_to_string(cam.get_acquisition_mode()))
-    print ("framerate bounds ",cam.get_frame_rate_bounds())
-    print ("Exp. Time bounds ",cam.get_exposure_time_bounds())
-    print ("Gain bounds      ",cam.get_gain_bounds())
+    print ("Available Formats : ",s['availableFormats'])
+    print ("acquisition_mode ",s['acquisitionMode'])
+    print ("framerate bounds ",s['frameRateBounds'])
+    print ("Exp. Time bounds ",s['expTimeBounds'])
+    print ("Gain bounds      ",s['gainBounds'])
     print ("")
 
 #--------------------------------------------------------------------------------------------
 
-def FLIR_Power(cam,dev,verbose):
+def FLIR_Power(cam,dev,verbose,cache=None):
 
     '''
-        Returns info on current power, temperature, etc.
+        Returns info on current power, temperature, etc. If a FLIR_Features.FeatureCache
+        is given, the values come from it (and are only re-read once they are stale).
     '''
 
-    volts=cam.get_float('PowerSupplyVoltage')
-    current=cam.get_float('PowerSupplyCurrent')
-    power=volts*current
-    temperature = dev.get_float_feature_value("DeviceTemperature")
+    if cache is not None:
+        volts,current,power,temperature = cache.power()
+    else:
+        volts=cam.get_float('PowerSupplyVoltage')
+        current=cam.get_float('PowerSupplyCurrent')
+        power=volts*current
+        temperature = dev.get_float_feature_value("DeviceTemperature")
 
     if verbose:
 
@@ -230,54 +673,219 @@ def Write_PNG(img,imName):
 
 #--------------------------------------------------------------------------------------------
 
-def Acquire_Frames(cam,nFrames,frameWait=1.0,verbose=False):
+def Open_Stream(cam,nBuffers,verbose=False):
 
     '''
-        Acquires and returns a single frame or multiple frames. If nFrames>1, the
-        routine first builds a list of individual frames and then returns the .stack of
-        the result. This means that if nFrames=1, the routine returns a 2D numpy array
-        of the frame, whereas if nFrames>1, it returns a 3D array of data. This makes
-        doing statistics "down the cube" easier.
+        Creates an Aravis stream for the camera and fills it with nBuffers preallocated
+        buffers, each cam.get_payload() bytes long. Buffers are popped as frames arrive
+        and pushed back once they have been converted, so no allocation happens while
+        the camera is running.
 
+            Input:    cam - the camera
+                      nBuffers - number of buffers in the pool
+                      verbose - how wordy to be
+            Returns:  stream - the Aravis.Stream, ready for start_acquisition()
+    '''
+
+    payload = cam.get_payload()               # Bytes per frame (depends on RoI, pixel format)
+    stream = cam.create_stream(None,None)     # No callback - we pop buffers ourselves
+
+    for i in range(nBuffers):
+        stream.push_buffer(Aravis.Buffer.new_allocate(payload))   # Preallocate the pool
+
+    if verbose:
+        print ("  Stream opened with ",nBuffers," buffers of ",payload," Bytes")
+
+    return stream
+
+#--------------------------------------------------------------------------------------------
+
+def Iter_Frames(cam,nFrames,frameWait=1.0,verbose=False,streaming=False,nBuffers=4,timeout=None,out=None,
+                telemetry=None):
+
+    '''
+        Generator that acquires nFrames frames and yields each one as soon as it has
+        arrived, so that saving, statistics or display can overlap with the exposures.
+
+            Input:    cam - the camera
+                      nFrames - number of frames to take
+                      frameWait, streaming, nBuffers, timeout - as for Acquire_Frames
+                      out - (optional) (nFrames, H, W) cube to convert the frames into
+                      telemetry - (optional) FLIR_Telemetry.AcqTelemetry to record frame
+                                  counts, failures, stage times, stream and link statistics
+            Yields:   img, meta - the frame (out[k], if out is given) and a dict with
+                                  'index', 'frameID', 'timestamp' (camera, ns),
+                                  'exposure' (uSec) and 'gain', plus 'crc' and
+                                  'sequencerSet' if those chunks are enabled
+
+        Exposure and gain are read once, before the acquisition starts, so no extra camera
+        round trips are made per frame. If chunk data is on (see Enable_Chunks), all the
+        metadata is instead parsed from the frame's own chunk data. If the consumer stops
+        early (break), the acquisition is stopped and the camera settings put back.
+
+        Frames that do not arrive (timeout, incomplete buffer, no data) are never handed
+        on; they are reported, and counted in the telemetry.
     '''
     import time     # To sleep between frames
 
     if verbose:
         print("  Starting acquisition of ",nFrames," frame(s)...")
 
-    cam.start_acquisition()    # Start acquisition process
+    tel = telemetry if telemetry is not None else FT.AcqTelemetry()   # Throwaway if not wanted
 
-    if nFrames==1:                       # Only a single frame
+    expTime,gain = cam.get_exposure_time(),cam.get_gain()     # Fixed for the whole sequence
+    tel.read_link(cam)
+    parser = None                                             # Chunk parser, made when first needed
 
-        rawFrame=cam.acquisition(0.0)        # Grab a single frame (timeout=0 means forever)
-        img = FLIR2numpy(rawFrame,verbose)   # Convert to numpy
+    def frameMeta(k,buf):
+        nonlocal parser
+        meta = {'index':k, 'frameID':buf.get_frame_id(), 'timestamp':buf.get_timestamp(),
+                'exposure':expTime, 'gain':gain}
+        if buf.has_chunks():            # Take what we can from the frame itself
+            if parser is None:
+                parser = cam.create_chunk_parser()
+            Chunk_Meta(parser,buf,meta)
+        return meta
 
-        if verbose:
-            print ("")
-            print ("Dimensions of image : ",img.shape)
-            print ("Mean, standard dev  ",np.mean(img), np.std(img))
-            print("")
+    if streaming:
+
+        if timeout is None:
+            timeout = expTime/1.0E6 + 2.0      # Exposure time plus readout margin (sec)
+
+        acqMode = cam.get_acquisition_mode()                         # Remember current settings
+        rateEnable = None                                            #   so we can put them back
+        if cam.is_feature_available('AcquisitionFrameRateEnable'):  # (not on the fake camera)
+            rateEnable = cam.get_boolean('AcquisitionFrameRateEnable')
+
+        if nFrames==1:
+            cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('SingleFrame')) )
+        elif cam.is_feature_available('AcquisitionFrameCount'):
+            cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('MultiFrame')) )
+            cam.set_integer('AcquisitionFrameCount',nFrames)      # Camera stops by itself after nFrames
+        else:
+            cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('Continuous')) )   # Stopped below
+
+        if rateEnable is not None:
+            cam.set_boolean('AcquisitionFrameRateEnable',False)  # Run as fast as exposure allows
+
+        stream = Open_Stream(cam,min(nBuffers,nFrames),verbose)   # No point in more buffers than frames
+
+        cam.start_acquisition()     # Start acquisition process
+
+        try:
+            k = 0
+            while k < nFrames:
+
+                with tel.stage('acquire'):
+                    rawFrame = stream.timeout_pop_buffer(int(timeout*1.0E6))     # Wait for next frame (uSec)
+
+                if rawFrame is None:
+                    print ("ERROR - Timed out waiting for frame ",k+1)
+                    tel.frame(ok=False)
+                    break
+
+                if rawFrame.get_status() == Aravis.BufferStatus.SUCCESS:
+                    with tel.stage('convert'):
+                        img = FLIR2numpy(rawFrame,False,None if out is None else out[k])   # Convert to numpy
+                        meta = frameMeta(k,rawFrame)
+                    stream.push_buffer(rawFrame)     # Give the buffer back before handing on the frame
+                    tel.frame(img.nbytes)
+                    if verbose:
+                        print ("    Frame ",k+1)     # Some feedback
+                    k += 1
+                    yield img,meta
+                else:
+                    if verbose:
+                        print ("    Dropped frame, status ",rawFrame.get_status())
+                    tel.frame(ok=False)
+                    stream.push_buffer(rawFrame)     # Give the buffer back to the pool
+
+        finally:
+            cam.stop_acquisition()     # Stop acquisition
+            tel.read_stream(stream)
+
+            cam.set_acquisition_mode(acqMode)                          # Back to previous settings
+            if rateEnable is not None:
+                cam.set_boolean('AcquisitionFrameRateEnable',rateEnable)
 
     else:
 
-        imList = []                 # Initialize list to hold numpy arrays
+        cam.start_acquisition()    # Start acquisition process
+
+        try:
+            for k in range(nFrames):    # Do this many
+
+                if verbose and nFrames>1:
+                    print ("    Frame ",k+1)       # Some feedback
+
+                with tel.stage('acquire'):
+                    rawFrame=cam.acquisition(0.0)      # Grab a single frame (timeout=0 means forever)
+
+                with tel.stage('convert'):
+                    img = FLIR2numpy(rawFrame,False,None if out is None else out[k])    # Convert to numpy
+
+                if img is None:
+                    print ("ERROR - No data for frame ",k+1)
+                    tel.frame(ok=False)
+                    break
+
+                tel.frame(img.nbytes)
+                yield img,frameMeta(k,rawFrame)
+
+                if k < nFrames-1:
+                    time.sleep(frameWait)   # Pause between exposures
+
+        finally:
+            cam.stop_acquisition()     # Stop acquisition
+
+#--------------------------------------------------------------------------------------------
+
+def Acquire_Frames(cam,nFrames,frameWait=1.0,verbose=False,streaming=False,nBuffers=4,timeout=None,fName=None):
+
+    '''
+        Acquires and returns a single frame or multiple frames. Frames are converted
+        straight into a (nFrames, H, W) cube allocated up front (see New_Cube). If
+        nFrames=1, the routine returns a 2D numpy array of the frame, whereas if
+        nFrames>1, it returns the 3D array of data. This makes doing statistics
+        "down the cube" easier.
 
-        for i in range(nFrames):    # Do this many
+        By default, frames are taken one at a time in SingleFrame mode, sleeping frameWait
+        seconds in between. With streaming=True, the camera is put in MultiFrame mode with
+        the frame rate limit switched off, and frames are popped from a pool of nBuffers
+        preallocated buffers (see Open_Stream) as fast as exposure and link allow. timeout
+        (seconds) is how long to wait for each frame; by default the exposure time plus 2 s.
 
-            if verbose:
-                print ("    Frame ",i+1)       # Some feedback
+        If fName is given, the frames are written straight into a memory-mapped .npy file
+        of that name (see New_Cube) and the memmap is returned.
 
-            rawFrame=cam.acquisition(0.0)       # Grab a single frame (timeout=0 means forever)
-            imN = FLIR2numpy(rawFrame,False)    # Convert to numpy
-            imList.append(imN)                  # Add it to the list
+        Returns None if no frame arrived at all (fewer frames than asked for are returned
+        as they are).
 
-            time.sleep(frameWait)   # Pause between exposures
+        This is a thin wrapper around Iter_Frames, which hands out the frames one by one.
 
-        img = np.stack(imList)      # Convert to 3D array
+    '''
 
-    cam.stop_acquisition()     # Stop acquisition
+    cube = New_Cube(cam,nFrames,fName)     # Frames are converted straight into this
+    nGot = 0                               # Frames acquired so far
+
+    for img,meta in Iter_Frames(cam,nFrames,frameWait,verbose,streaming,nBuffers,timeout,cube):
+        nGot += 1
+
+    if fName is not None:
+        cube.flush()                       # Make sure it's all on disk
+
+    if nGot < 1:
+        print("ERROR - No frames acquired")
+        return None
+
+    img = cube[0] if nFrames==1 else cube[:nGot]     # 2D for a single frame, otherwise 3D
 
     if verbose:
+        if nFrames==1:
+            print ("")
+            print ("Dimensions of image : ",img.shape)
+            print ("Mean, standard dev  ",np.mean(img), np.std(img))
+            print("")
         print ("  Returning image data with dimensions ",img.shape)
 
     return img
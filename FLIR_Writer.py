@@ -0,0 +1,302 @@
+'''
+    Background (write-behind) writing of frame cubes, so the camera does not sit idle
+    while a cube goes to disk.
+
+            Cube_File   - The file name Write_Cube uses for a given name and format
+           Write_Cube   - Writes a cube to disk straight away (npy, npz, fits or fla), atomically
+            Read_Cube   - Reads a cube back (npy memory-mapped, so it is read as needed)
+           CubeWriter   - Queue of cubes written by a pool of background threads
+
+    The queue is bounded: if the disk falls behind, submit() blocks until there is room,
+    so memory use stays limited to a few cubes. Everything still queued is written out
+    when the writer is closed, or when Python exits. A callback given to submit() is
+    called once the file is safely on disk (e.g. FLIR_Checkpoint.Checkpoint.file_written),
+    with the SHA-256 of its contents, worked out as the data went to the file.
+
+'''
+
+import atexit
+import hashlib
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+import FLIR_Archive as FA    # Compressed archive files
+
+#--------------------------------------------------------------------------------------------
+
+def Cube_File(fName,fmt='npy'):
+
+    ''' The name Write_Cube writes fName to (with ".npy", ".npz" or ".fla" added if not there) '''
+
+    ext = {'npy':'.npy', 'npz':'.npz', 'fla':'.fla'}.get(fmt)
+
+    return fName+ext if ext and not fName.endswith(ext) else fName
+
+def _fsync(fName):
+
+    ''' Makes sure the contents of fName are on the disk '''
+
+    fd = os.open(fName,os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class _HashingFile:
+
+    '''
+        Passes writes on to a file, keeping the SHA-256 of everything written. It cannot
+        seek, so the writers (np.save, zipfile, astropy, FLIR_Archive) write straight
+        through, in order.
+    '''
+
+    def __init__(self,f):
+
+        self._f = f
+        self._hash = hashlib.sha256()
+        self._pos = 0
+        self.mode = f.mode
+        self.name = f.name
+
+    def write(self,data):
+
+        self._hash.update(data)
+        self._pos += len(memoryview(data).cast('B'))
+        return self._f.write(data)
+
+    def read(self,*args):       # Only there because np.savez looks for it
+        raise OSError("write-only file")
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        self._f.flush()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+def Write_Cube(fName,data,fmt='npy'):
+
+    '''
+        Writes a (single frame or cube) numpy array to disk. The data go to a temporary
+        file first, which is synced and then renamed, so after a crash the file is either
+        complete or not there at all. The checksum is taken as the data are written, so
+        the file is never read back.
+
+            Input:    fName - file name. For npy, npz and fla the extension is added if not
+                              there (see Cube_File)
+                      data - the numpy array
+                      fmt - 'npy' (np.save), 'npz' (compressed, np.savez_compressed),
+                            'fits' (primary HDU, requires astropy) or 'fla' (compressed
+                            archive with 12-bit packing and per-frame access, see FLIR_Archive)
+            Returns:  the name of the file written, and the SHA-256 (hex) of its contents
+    '''
+
+    if fmt not in ('npy','npz','fits','fla'):
+        raise ValueError("Unknown output format "+str(fmt))
+
+    outName = Cube_File(fName,fmt)
+    tmpName = outName+'.tmp'
+
+    with open(tmpName,"wb") as raw:       # A file object, so nothing is added to the name
+        f = _HashingFile(raw)
+
+        if fmt == 'npy':
+            np.save(f,data)
+
+        elif fmt == 'npz':
+            np.savez_compressed(f,data=data)
+
+        elif fmt == 'fits':
+            from astropy.io import fits       # Only needed for FITS output
+            fits.PrimaryHDU(data).writeto(f)
+
+        elif fmt == 'fla':
+            FA.Write_Archive(f,data)
+
+    _fsync(tmpName)
+    os.replace(tmpName,outName)
+
+    return outName,f.hexdigest()
+
+#--------------------------------------------------------------------------------------------
+
+def _file_format(fName):
+
+    '''
+        Format of a cube written by Write_Cube as fName, and the file it is in. The
+        extensions Cube_File adds are tried first, then the file itself is recognised by
+        its first bytes (so e.g. FITS written as "x.dat" is found). Returns (None, fName)
+        if there is no such file.
+    '''
+
+    for fmt in ('npy','npz','fla'):
+        if not fName.endswith('.'+fmt) and os.path.exists(Cube_File(fName,fmt)):
+            return fmt,Cube_File(fName,fmt)
+
+    if not os.path.exists(fName):
+        return None,fName
+
+    with open(fName,"rb") as f:
+        head = f.read(9)
+
+    if head.startswith(b'\x93NUMPY'):
+        return 'npy',fName
+    if head.startswith(b'PK'):
+        return 'npz',fName
+    if head.startswith(FA.MAGIC):
+        return 'fla',fName
+    if head.startswith(b'SIMPLE  ='):
+        return 'fits',fName
+
+    return None,fName
+
+def Read_Cube(fName,fmt=None):
+
+    '''
+        Reads back a cube written by Write_Cube. A .npy file is memory-mapped (read-only),
+        so only the parts actually used are read from disk.
+
+            Input:    fName - file name
+                      fmt - 'npy', 'npz', 'fits' or 'fla'; None = from the file name extension
+                  or, failing that, from the file (see _file_format)
+            Returns:  the numpy array (or memmap)
+    '''
+
+    if fmt is None:
+        fmt = fName.rsplit('.',1)[-1].lower() if '.' in fName else None
+        if fmt == 'fit':
+            fmt = 'fits'
+        elif fmt not in ('npy','npz','fits','fla'):     # e.g. CharFLIR's ".dat" names, saved as .dat.npy, .dat.npz, ...
+            fmt,fName = _file_format(fName)
+            if fmt is None:
+                raise FileNotFoundError("No cube "+fName+" (tried .npy, .npz, .fla and the file itself)")
+
+    if fmt == 'npy':
+        if not fName.endswith('.npy'):
+            fName = fName+'.npy'
+        return np.load(fName,mmap_mode='r')
+
+    elif fmt == 'npz':
+        fName = Cube_File(fName,'npz')
+        with np.load(fName) as f:
+            return f['data']
+
+    elif fmt == 'fits':
+        from astropy.io import fits       # Only needed for FITS input
+        return fits.getdata(fName)
+
+    elif fmt == 'fla':
+        if not fName.endswith('.fla'):
+            fName = fName+'.fla'
+        return FA.ArchiveReader(fName)[:]
+
+    else:
+        raise ValueError("Unknown input format "+str(fmt))
+
+#--------------------------------------------------------------------------------------------
+
+class CubeWriter:
+
+    '''
+        Writes cubes in the background, using nThreads threads fed from a queue that
+        holds at most maxQueue cubes. The writing itself (file I/O, compression) runs
+        outside the GIL, so acquisition carries on meanwhile.
+
+            Input:    fmt - default output format (see Write_Cube)
+                      nThreads - number of writer threads
+                      maxQueue - cubes allowed to wait before submit() blocks
+                      verbose - how wordy to be
+                      telemetry - (optional) FLIR_Telemetry.AcqTelemetry; write times go
+                                  into its 'write' stage
+
+        A submitted array must not be changed afterwards: it is written as is, later.
+    '''
+
+    def __init__(self,fmt='npy',nThreads=2,maxQueue=2,verbose=False,telemetry=None):
+
+        self.fmt = fmt
+        self.verbose = verbose
+        self.telemetry = telemetry
+        self.errors = []                          # (fName, exception) for failed writes
+        self._queue = queue.Queue(maxQueue)       # Bounded - gives the backpressure
+        self._threads = []
+        self._closed = False
+
+        for i in range(nThreads):
+            t = threading.Thread(target=self._worker,name="CubeWriter-"+str(i),daemon=True)
+            t.start()
+            self._threads.append(t)
+
+        atexit.register(self.close)      # Never lose queued data at exit
+
+    def _worker(self):
+
+        while True:
+
+            job = self._queue.get()
+
+            if job is None:               # Sentinel - time to stop
+                self._queue.task_done()
+                return
+
+            fName,data,fmt,done = job
+
+            try:
+                t0 = time.perf_counter()
+                outName,checksum = Write_Cube(fName,data,fmt)
+                if self.telemetry is not None:
+                    self.telemetry.add_time('write',time.perf_counter()-t0)
+                if self.verbose:
+                    print ("  Wrote ",outName)
+                if done is not None:
+                    done(outName,checksum)
+            except Exception as err:
+                print ("ERROR - Failed to write ",fName," : ",err)
+                self.errors.append((fName,err))
+            finally:
+                self._queue.task_done()
+
+    def submit(self,fName,data,fmt=None,done=None):
+
+        '''
+            Queues data to be written to fName. Blocks while the queue is full.
+            done, if given, is called (in the writer thread) with the name of the file
+            written and its SHA-256, once it is complete on disk. It is not called if the
+            write fails.
+        '''
+
+        if self._closed:
+            raise RuntimeError("CubeWriter is closed")
+
+        self._queue.put((fName,data,fmt or self.fmt,done))
+
+    def flush(self):
+
+        '''
+            Waits until everything submitted so far has been written.
+        '''
+
+        self._queue.join()
+
+    def close(self):
+
+        '''
+            Writes out everything still queued and stops the threads. Safe to call twice.
+        '''
+
+        if self._closed:
+            return
+
+        self._closed = True
+
+        for t in self._threads:
+            self._queue.put(None)         # One sentinel per thread
+        for t in self._threads:
+            t.join()
+
+        atexit.unregister(self.close)
@@ -12,30 +12,35 @@ import ctypes
 import numpy as np
 import matplotlib.pyplot as plt
 
-def printStatus(cam):
+import FLIR_Features as FF        # Cached access to camera features
+
+def printStatus(cam,cache=None):
     dev = cam.get_device()    # Allows access to "deeper" features
-    [fullWidth,fullHeight] = cam.get_sensor_size()    # Full frame size
-    [x,y,width,height] = cam.get_region()             # Get RoI details
-    vlt=cam.get_float('PowerSupplyVoltage')
-    cur=cam.get_float('PowerSupplyCurrent')
+    if cache is None:
+        cache = FF.FeatureCache(cam,dev)
+    s = cache.snapshot(('settings','volatile'))      # One read per feature
+    [fullWidth,fullHeight] = cache.get('sensorSize')  # Full frame size
+    [x,y,width,height] = s['region']                  # Get RoI details
+    vlt=s['volts']
+    cur=s['current']
 
 
     print ("")
     print("Full Frame is : %dx%d "%(fullWidth,fullHeight))
     print("ROI           : %dx%d at %d,%d" %(width, height, x, y))
-    print("Pixel format  : %s" %(cam.get_pixel_format_as_string()))
-    print("Framerate     : %s Hz" %(cam.get_frame_rate()))
-    print("Exposure time : %s seconds " %(cam.get_exposure_time()/1.0E6))
+    print("Pixel format  : %s" %(s['pixelFormat']))
+    print("Framerate     : %s Hz" %(s['frameRate']))
+    print("Exposure time : %s seconds " %(s['expTime']))
     print ("Power Supply Voltage   : ",vlt," V")
     print ("Power Supply Current   : ",cur," A")
     print ("Total Dissiapted Power :",vlt*cur, "W")
-    print("Camera Temp   : %s C" % (dev.get_float_feature_value("DeviceTemperature")))
+    print("Camera Temp   : %s C" % (s['temperature']))
     print("")
 
-    print ("acquisition_mode ",Aravis.acquisition_mode_to_string(cam.get_acquisition_mode()))
-    print("Gain Conv.    : ",cam.get_string('GainConversion'))
-    print("Gain Setting  : ",cam.get_gain())
-    print("Exposure time : %s seconds " %(cam.get_exposure_time()/1.0E6))
+    print ("acquisition_mode ",s['acquisitionMode'])
+    print("Gain Conv.    : ",s['gainConv'])
+    print("Gain Setting  : ",s['gain'])
+    print("Exposure time : %s seconds " %(s['expTime']))
     print("")
 
 
@@ -46,6 +46,8 @@
 
 '''
 
+import json
+
 import numpy as np
 
 scNm = "FLIR_Darks_1.txt"      # Name of script file to write
@@ -61,6 +63,13 @@ gain = [0.0,5.0,15.0,25.0,35.0,45.0,47.994294]    # Array of gain values
 # eTLmax = [30.0,25.0,8.0,2.5,0.8,0.25,0.18]        # Max exposure time LCG mode
 eTHmax = [30.0,30.0,30.0,30.0,5.0,1.0,1.0]         # Max exposure time HCG mode
 eTLmax = [30.0,30.0,30.0,30.0,25.0,8.0,5.0]        # Max exposure time LCG mode
+
+limitsFile = None    # Limits measured by FLIR_AutoRange.py (e.g. 'ExpLimits.json'), used instead of the tables above
+if limitsFile:
+    with open(limitsFile,"r") as f:
+        limits = json.load(f)
+    gain,eTHmax,eTLmax = limits['gain'],limits['eTHmax'],limits['eTLmax']
+
 gModes = ["HCG","LCG"]                            # Gain modes
 
 nGains = len(gain)   # This many gain settings
@@ -56,6 +56,8 @@
 
 '''
 
+import json
+
 import numpy as np
 
 scNm = "MV_Feb13.txt"       # Name of script file to write
@@ -76,6 +78,12 @@ gModes = ["HCG","LCG"]                            # Gain modes
 # eTHmax = [30.0,30.0,30.0,30.0,5.0,1.0,1.0]         # Max exposure time HCG mode  VALUES for Dakr case
 # eTLmax = [30.0,30.0,30.0,30.0,25.0,8.0,5.0]        # Max exposure time LCG mode
 
+limitsFile = None    # Limits measured by FLIR_AutoRange.py (e.g. 'ExpLimits.json'), used instead of the tables above
+if limitsFile:
+    with open(limitsFile,"r") as f:
+        limits = json.load(f)
+    gain,eTHmax,eTLmax = limits['gain'],limits['eTHmax'],limits['eTLmax']
+
 
 nGains = len(gain)   # This many gain settings
 nGmodes = 2          # And this many gain modes
@@ -0,0 +1,219 @@
+'''
+    Python script to benchmark the acquisition path on the Aravis fake camera
+    (arv-fake-gv-camera-0.8), so no hardware is needed.
+
+    For each mode, RoI size and number of frames it measures:
+
+        latency      - time waiting for each frame (sec/frame)
+        fps          - sustained frames per second
+        convert      - FLIR2numpy conversion time (sec/frame)
+        stats        - FLIR_Stats.FrameStats.add time (sec/frame)
+
+    Modes:
+
+        single       - frames taken one at a time in SingleFrame mode (as Acquire_Frames)
+        streaming    - frames streamed through a buffer pool (as Acquire_Frames, streaming=True)
+        generator    - Iter_Frames streaming, with the statistics done as the frames arrive
+
+    and, for the largest cube taken, the write throughput (MB/s) of each output format.
+
+    Results are written to bench_FLIR.json and compared with bench_FLIR_baseline.json, if
+    there is one: anything more than tolerance worse than the baseline is reported, and the
+    script exits with status 1. Run it as:
+
+        python bench_FLIR.py              (benchmark and compare)
+        python bench_FLIR.py baseline     (benchmark and store the result as the baseline)
+
+'''
+
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import FLIR_Utils as FU          # All the camera interface stuff
+import FLIR_Stats as FS          # Streaming frame statistics
+import FLIR_Writer as FW         # Writing the data
+import FLIR_Telemetry as FT      # Stage timing
+
+#--------------------------------------------------------------------------------------------
+
+verbose = False
+
+benchFile = 'bench_FLIR.json'              # Results of this run
+baselineFile = 'bench_FLIR_baseline.json'  # Results to compare with
+tolerance = 0.20                           # Fractional change that counts as a regression
+
+modes = ['single','streaming','generator']
+roiSizes = [(512,512),(256,256),(64,64)]   # Width, height (cut to the fake sensor)
+frameCounts = [1,10,50]
+writeFormats = ['npy','npz','fla']
+expTime = 1000.0                           # Exposure time (uSec)
+
+# Metric : True if higher is better
+
+METRICS = {'latency':False, 'fps':True, 'convert':False, 'stats':False, 'MBps':True}
+
+#--------------------------------------------------------------------------------------------
+
+def benchAcquire(cam,mode,nFrames):
+
+    '''
+        Takes nFrames frames in the given mode. Returns the metrics and the cube.
+    '''
+
+    tel = FT.AcqTelemetry()
+    stats = FS.FrameStats()
+    cube = FU.New_Cube(cam,nFrames)
+    statsTime = 0.0
+
+    if mode == 'generator':
+        for img,meta in FU.Iter_Frames(cam,nFrames,0.0,verbose,True,out=cube,telemetry=tel):
+            t0 = time.perf_counter()
+            stats.add(img)
+            statsTime += time.perf_counter()-t0
+    else:
+        for img,meta in FU.Iter_Frames(cam,nFrames,0.0,verbose,mode=='streaming',out=cube,telemetry=tel):
+            pass
+        t0 = time.perf_counter()
+        stats.add(cube[:tel.nFrames])
+        statsTime = time.perf_counter()-t0
+
+    rec = tel.record()
+    nGot = max(tel.nFrames,1)
+
+    result = {'latency' : rec['stages'].get('acquire',{}).get('perFrame',0.0),
+              'convert' : rec['stages'].get('convert',{}).get('perFrame',0.0),
+              'stats'   : statsTime/nGot,
+              'frames'  : tel.nFrames,
+              'failed'  : tel.nFailed}
+    if nFrames > 1:
+        result['fps'] = tel.fps()
+
+    return result,cube[:tel.nFrames]
+
+#--------------------------------------------------------------------------------------------
+
+def benchWrite(cube,tmpDir):
+
+    '''
+        Write throughput (MB/s) of each output format for cube.
+    '''
+
+    results = {}
+
+    for fmt in writeFormats:
+        fName = os.path.join(tmpDir,"bench."+fmt)
+        t0 = time.perf_counter()
+        FW.Write_Cube(fName,cube,fmt)
+        dt = time.perf_counter()-t0
+        results['write/'+fmt] = {'MBps':cube.nbytes/1.0E6/dt}
+
+    return results
+
+#--------------------------------------------------------------------------------------------
+
+def compareBaseline(results,baseline):
+
+    '''
+        Compares results with baseline. Returns a list of (key, metric, baseline value,
+        new value, change) for everything more than tolerance worse.
+    '''
+
+    worse = []
+
+    for key,metrics in results.items():
+        for metric,value in metrics.items():
+
+            if metric not in METRICS or key not in baseline or metric not in baseline[key]:
+                continue
+
+            old = baseline[key][metric]
+            if old <= 0:
+                continue
+
+            change = value/old - 1.0
+            if (change < -tolerance) if METRICS[metric] else (change > tolerance):
+                worse.append((key,metric,old,value,change))
+
+    return worse
+
+#--------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    cam,dev = FU.Setup_Camera(verbose,True)      # The fake camera
+
+    sensorWid,sensorHgt = cam.get_sensor_size()
+    cam.set_exposure_time(expTime)
+    rateMin,rateMax = cam.get_frame_rate_bounds()
+    cam.set_frame_rate(rateMax)                  # As fast as the fake camera goes
+    try:
+        cam.set_pixel_format_from_string('Mono16')
+    except Exception:
+        print ("  Mono16 not available, using ",cam.get_pixel_format_as_string())
+
+    results = {}
+    tmpDir = tempfile.mkdtemp()
+    biggest = None
+
+    try:
+        for width,height in roiSizes:
+
+            width,height = min(width,sensorWid),min(height,sensorHgt)
+            cam.set_region(0,0,width,height)
+
+            for mode in modes:
+                for nFrames in frameCounts:
+
+                    key = mode+"/"+str(width)+"x"+str(height)+"/"+str(nFrames)
+                    results[key],cube = benchAcquire(cam,mode,nFrames)
+
+                    print ("  ",key.ljust(24)," ".join(k+" "+"{:.3e}".format(v) for k,v in results[key].items()))
+
+                    if biggest is None or cube.nbytes > biggest.nbytes:
+                        biggest = cube
+
+        results.update(benchWrite(biggest,tmpDir))
+        for fmt in writeFormats:
+            print ("   write/"+fmt.ljust(18)," MBps ","{:.1f}".format(results['write/'+fmt]['MBps']))
+
+    finally:
+        shutil.rmtree(tmpDir)
+
+    record = {'time':time.time(), 'host':platform.node(), 'python':platform.python_version(),
+              'numpy':np.__version__, 'results':results}
+
+    with open(benchFile,"w") as f:
+        json.dump(record,f,indent=1)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'baseline':
+        shutil.copyfile(benchFile,baselineFile)
+        print ("")
+        print ("Stored as the baseline in ",baselineFile)
+        sys.exit(0)
+
+    if not os.path.exists(baselineFile):
+        print ("")
+        print ("No baseline to compare with (run with 'baseline' to store one)")
+        sys.exit(0)
+
+    with open(baselineFile,"r") as f:
+        baseline = json.load(f)['results']
+
+    worse = compareBaseline(results,baseline)
+
+    print ("")
+    if worse:
+        print ("REGRESSIONS (more than ",int(100*tolerance),"% worse than ",baselineFile,"):")
+        for key,metric,old,new,change in worse:
+            print ("  ",key.ljust(24),metric.ljust(8),"{:.3e}".format(old)," -> ","{:.3e}".format(new),
+                   "  ("+"{:+.0f}".format(100*change)+"%)")
+        sys.exit(1)
+    else:
+        print ("No regressions against ",baselineFile)
@@ -28,6 +28,8 @@ import matplotlib.pyplot as plt
 from astropy.io import fits       # To read and write FITS files (for diagnostics)
 
 import FLIR_Utils as FU           # All the camera interface stuff
+import FLIR_Features as FF        # Cached access to camera features
+import FLIR_Calib as FC           # Bias, dark and flat calibration
 
 #--------------------------------------------------------------------------------------------
 
@@ -37,6 +39,7 @@ fakeCam = False   # Whether to use the Aravis "fake" camera (software) instead o
 verbose = True    # How wordy to be
 showImg = True    # Whether to show the resulting image with matplotlib
 writeFITS = True  # Whether to write a "temp.fits" file of the result
+calibFile = None  # Master bias/dark/flat (FLIR_Calib.Save_Masters) to calibrate the frame with, if any
 
 print ("-----")
 
@@ -47,7 +50,8 @@ from gi.repository import Aravis
 
 cam,dev = FU.Setup_Camera(verbose,False)    # Instantiate camera and dev
 FU.Standard_Settings(cam,dev,verbose)       # Standard settings (full frame, etc.)
-FU.FLIR_Status(cam,dev)                     # Print out camera info
+cache = FF.FeatureCache(cam,dev)            # Each feature read from the camera only once
+FU.FLIR_Status(cam,dev,cache)               # Print out camera info
 
 # Aravis.update_device_list()
 
@@ -117,25 +121,18 @@ cam.set_string('GainConversion',GCM)     # Set gain conversion mode
 cam.set_gain(GainSetting)                #   and Gain Setting
 cam.set_exposure_time(ExpTime*1.0E6)     # Exposure time (uSec)
 
-#---
-
-cam.set_acquisition_mode( (Aravis.acquisition_mode_from_string('SingleFrame')) )   # Set to single frames
-
-cam.set_boolean('ReverseX',False)     # Use these to flip left-right
-cam.set_boolean('ReverseY',False)     #   and up-down
+#---  Single frame mode, no flips, 12-bit ADC, no defect correction etc. are all
+#     part of FU.Standard_Settings above, so need not be set again here.
 
 # cam.set_string('ImageCompressionMode','Off')           # Definitely don't want this (WRITE-PROTECTED?)
-cam.set_string('AdcBitDepth','Bit12')                  # Only option for this camera
-cam.set_string('DeviceTemperatureSelector','Sensor')   # Only option for this camera
-
-cam.set_boolean('DefectCorrectStaticEnable',False)     # Turn off auto-correction of (known) bad pixels
 
-dev = cam.get_device()    # Allows access to "deeper" features
+cache.invalidate()        # Settings have changed since FLIR_Status
 
 ###--- Essential Camera Info
 
-[fullWidth,fullHeight] = cam.get_sensor_size()    # Full frame size
-[x,y,width,height] = cam.get_region()             # Get RoI details
+s = cache.snapshot()                          # All values, read in one go
+[fullWidth,fullHeight] = s['sensorSize']      # Full frame size
+[x,y,width,height] = s['region']              # Get RoI details
 
 ###--- Optional Feedback
 
@@ -145,24 +142,24 @@ if verbose:
     print ("")
     print("Full Frame is : %dx%d "%(fullWidth,fullHeight))
     print("ROI           : %dx%d at %d,%d" %(width, height, x, y))
-    print("Pixel format  : %s" %(cam.get_pixel_format_as_string()))
-    print("Framerate     : %s Hz" %(cam.get_frame_rate()))
-    print("Exposure time : %s seconds " %(cam.get_exposure_time()/1.0E6))
-    print("Gain Conv.    : ",cam.get_string('GainConversion'))
-    print("Gamma enable  : ",cam.get_boolean('GammaEnable'))
-    print("Gamma value   : ",cam.get_float('Gamma'))
-    print("Camera Temp   : %s C" % (dev.get_float_feature_value("DeviceTemperature")))
+    print("Pixel format  : %s" %(s['pixelFormat']))
+    print("Framerate     : %s Hz" %(s['frameRate']))
+    print("Exposure time : %s seconds " %(s['expTime']))
+    print("Gain Conv.    : ",s['gainConv'])
+    print("Gamma enable  : ",s['gammaEnable'])
+    print("Gamma value   : ",s['gamma'])
+    print("Camera Temp   : %s C" % (s['temperature']))
     print("")
 
-    print ("Available Formats : ",cam.dup_available_pixel_formats_as_display_names ())
-    print ("acquisition_mode ",Aravis.acquisition_mode_to_string(cam.get_acquisition_mode()))
-    print ("framerate bounds ",cam.get_frame_rate_bounds())
-    print ("Exp. Time bounds ",cam.get_exposure_time_bounds())
-    print ("Gain bounds      ",cam.get_gain_bounds())
+    print ("Available Formats : ",s['availableFormats'])
+    print ("acquisition_mode ",s['acquisitionMode'])
+    print ("framerate bounds ",s['frameRateBounds'])
+    print ("Exp. Time bounds ",s['expTimeBounds'])
+    print ("Gain bounds      ",s['gainBounds'])
     print ("")
 
-    vlt=cam.get_float('PowerSupplyVoltage')
-    cur=cam.get_float('PowerSupplyCurrent')
+    vlt=s['volts']
+    cur=s['current']
     print ("Power Supply Voltage   : ",vlt," V")
     print ("Power Supply Current   : ",cur," A")
     print ("Total Dissiapted Power :",vlt*cur, "W")
@@ -176,6 +173,8 @@ if verbose:
 
 ###--- Do the Acquisition
 
+calib = FC.Calibrator.load(calibFile) if calibFile else None
+
 print("Start acquisition")
 cam.start_acquisition()
 for i in range(1):
@@ -185,14 +184,17 @@ for i in range(1):
 
     np.save("temp.npy",npFrame)             # Save a binary version
 
+    if calib is not None:
+        npFrame = calib.apply(npFrame,ExpTime)  # (img - bias - dark*t) / flat
+
     if verbose:
 
         print ("")
         print ("Dimensions of image ",i," : ",npFrame.shape)
         
-        print("Gain Conv.    : ",cam.get_string('GainConversion'))
-        print("Gain Setting  : ",cam.get_gain())
-        print("Exposure time : %s seconds " %(cam.get_exposure_time()/1.0E6))
+        print("Gain Conv.    : ",cache.get('gainConv'))
+        print("Gain Setting  : ",cache.get('gain'))
+        print("Exposure time : %s seconds " %(cache.get('expTime')))
 
     if writeFITS:   # Write "temp.fits" with result
         hdu = fits.PrimaryHDU(npFrame)            # Create HDU of new data
@@ -0,0 +1,64 @@
+'''
+    Tests of FLIR_Stats (run with pytest; numpy only, no camera needed).
+'''
+
+import numpy as np
+
+import FLIR_Stats as FS
+
+#--------------------------------------------------------------------------------------------
+
+def framesToConverge(jitter,targetRSE=0.05,minFrames=6,maxFrames=200,seed=0):
+
+    ''' Frames of Gaussian noise, with an offset jitter from frame to frame, taken before variance_rse() drops below targetRSE '''
+
+    rng = np.random.default_rng(seed)
+    stats = FS.FrameStats()
+
+    while stats.n < maxFrames:
+        stats.add(rng.normal(100.0,5.0,(64,64)) + rng.normal(0.0,jitter))
+        if stats.n >= minFrames and stats.variance_rse() < targetRSE:
+            break
+
+    return stats.n
+
+def test_rse_matches_scatter():
+
+    rng = np.random.default_rng(1)
+    variances,rses = [],[]
+
+    for trial in range(200):
+        stats = FS.FrameStats()
+        ramp = np.linspace(-1.0,1.0,64)[:,None]
+        for i in range(15):
+            stats.add(rng.normal(100.0,5.0,(64,64)) + rng.normal(0.0,3.0) + rng.normal(0.0,3.0)*ramp)
+        variances.append(stats.variance())
+        rses.append(stats.variance_rse())
+
+    scatter = np.std(variances)/np.mean(variances)
+    assert 0.7*scatter < np.mean(rses) < 1.3*scatter
+
+def test_drift_sets_frame_count():
+
+    nSteady,nDrift = framesToConverge(0.0),framesToConverge(5.0)
+
+    assert nSteady == 6
+    assert nDrift > nSteady + 20
+
+def test_mask():
+
+    cube = np.random.default_rng(2).normal(100.0,5.0,(10,32,32))
+    mask = np.zeros((32,32),dtype=bool)
+    mask[3,4] = mask[20,30] = True
+    cube[:,3,4] = 1.0E6*np.arange(10)                 # A bad pixel that would swamp the rest
+
+    stats = FS.FrameStats(mask=mask)
+    stats.add(cube)
+
+    assert stats.variance_rse() < 0.05
+
+def test_no_frames():
+
+    stats = FS.FrameStats()
+    assert np.isnan(stats.mean()) and np.isnan(stats.variance())
+    assert stats.variance_rse() is None